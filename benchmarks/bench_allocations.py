@@ -0,0 +1,79 @@
+"""
+匹配循环内存分配基准：对比 "每次调用新分配"（复用前的行为）与 BufferArena 复用缓冲区
+- 工作函数在本进程内串行执行（serial 执行后端），以便 tracemalloc 统计到工作函数内的 numpy 分配
+- 每帧分配: 掩码图 / 得分图 / 膨胀图 / HSV 中间结果等缓冲区的新分配次数与字节数（稳态，取预热后一帧）
+- 峰值: tracemalloc 记录的单帧内存峰值（相对帧开始时）
+
+用法: python -m benchmarks.bench_allocations
+"""
+import json
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import vision.buffer_arena as buffer_arena
+from game_analyzer import GameAnalyzer
+from vision.buffer_arena import BufferArena
+
+SAMPLE = Path("pictures/qipan/1.png")
+REGIONS_FILE = Path("data/regions.json")
+THRESHOLD = 0.8
+SCENARIOS = (("整帧", False, "full"), ("区域", True, "full"), ("节点", True, "lattice"))
+
+
+class _NoReuseArena(BufferArena):
+    """每次 get() 都新分配，模拟复用前每次调用都分配结果数组的行为"""
+
+    def __init__(self):
+        super().__init__()
+        self.allocated_bytes = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        buffer = np.empty(shape, dtype=dtype)
+        self.allocations += 1
+        self.allocated_bytes += buffer.nbytes
+        return buffer
+
+
+def _measure(analyzer: GameAnalyzer, frame, mode: str, reuse: bool):
+    arena = BufferArena() if reuse else _NoReuseArena()
+    buffer_arena._local.arena = arena
+    analyzer.analyze_screenshot(frame, THRESHOLD, return_detections=True, detection_mode=mode)  # 预热
+    before = (arena.allocations, _allocated_bytes(arena), arena.reuses)
+
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    analyzer.analyze_screenshot(frame, THRESHOLD, return_detections=True, detection_mode=mode)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    after = (arena.allocations, _allocated_bytes(arena), arena.reuses)
+    return (*(a - b for a, b in zip(after, before)), peak - start)
+
+
+def _allocated_bytes(arena: BufferArena) -> int:
+    return arena.allocated_bytes if isinstance(arena, _NoReuseArena) else arena.nbytes
+
+
+def main():
+    analyzer = GameAnalyzer("vision/new_templates", executor="serial")
+    # 关闭跨帧缓存，每帧都走完整匹配
+    analyzer.incremental = False
+    analyzer.crop_cache = None
+    regions = json.loads(REGIONS_FILE.read_text())
+    frame = cv2.imread(str(SAMPLE))
+
+    print(f"{'场景':<6}{'方式':<8}{'每帧分配次数':>14}{'每帧分配(MB)':>14}{'复用次数':>10}{'峰值(MB)':>10}")
+    for scenario, locked, mode in SCENARIOS:
+        analyzer.lock_regions(regions if locked else None)
+        for label, reuse in (("新分配", False), ("复用", True)):
+            allocations, nbytes, reuses, peak = _measure(analyzer, frame, mode, reuse)
+            print(f"{scenario:<6}{label:<8}{allocations:>14}{nbytes / 1e6:>14.1f}{reuses:>10}{peak / 1e6:>10.1f}")
+    analyzer.pool.close()
+
+
+if __name__ == "__main__":
+    main()
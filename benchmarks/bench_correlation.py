@@ -0,0 +1,73 @@
+"""
+相关匹配后端基准：cv2.matchTemplate 逐模板 vs FFT 频域批量相关（vision.correlation）
+- 搜索图取样例截图某颜色的掩码灰度图，整帧 1024x738 以及若干 ROI 尺寸
+- 模板数取同一颜色的 12 / 24 / 36 个
+- fft(冷) 含模板频谱计算；fft(热) 为同尺寸后续帧复用已缓存频谱
+- 报告每种组合下更快的后端，以及两者得分图的最大偏差
+
+单进程运行，不含进程池调度开销。
+用法: python -m benchmarks.bench_correlation
+"""
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from vision.correlation import FFTCorrelator, correlate
+from vision.templates_manager import TemplatesManager
+from vision.utils import build_hsv_label_luts, hsv_label_image
+
+SAMPLE = Path("pictures/qipan/1.png")
+COLOR = "blue"
+COLOR_RANGES = {
+    'blue':   {'lower': [100, 80, 80], 'upper': [130, 255, 255]},
+    'green':  {'lower': [35, 40, 40], 'upper': [95, 255, 255]},
+    'orange': {'lower': [5, 150, 150], 'upper': [20, 255, 255]},
+    'purple': {'lower': [135, 80, 80], 'upper': [160, 255, 255]}
+}
+# (宽, 高)：整帧与典型 ROI（单个玩家区域约 230x260，节点窗口约 50x50）
+SIZES = [(1024, 738), (512, 512), (260, 230), (128, 128), (50, 50)]
+TEMPLATE_COUNTS = (12, 24, 36)
+ROUNDS = 3
+
+
+def _best_of(fn) -> float:
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    manager = TemplatesManager("vision/new_templates", color_ranges=COLOR_RANGES)
+    templates = [entry.gray for entry in manager.bank.for_color(COLOR)]
+    frame = cv2.imread(str(SAMPLE))
+    labels = hsv_label_image(frame, build_hsv_label_luts(COLOR_RANGES))
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    masked = cv2.bitwise_and(gray, gray, mask=cv2.compare(labels, list(COLOR_RANGES).index(COLOR) + 1, cv2.CMP_EQ))
+
+    print(f"{'搜索图':<12}{'模板数':>6}{'opencv(ms)':>12}{'fft冷(ms)':>12}{'fft热(ms)':>12}{'胜出':>10}{'最大偏差':>12}")
+    for width, height in SIZES:
+        # ROI 取画面中心（棋盘所在位置），保证搜索图内有真实棋子
+        x0, y0 = (masked.shape[1] - width) // 2, (masked.shape[0] - height) // 2
+        image = np.ascontiguousarray(masked[y0:y0 + height, x0:x0 + width])
+        for count in TEMPLATE_COUNTS:
+            subset = templates[:count]
+            opencv_time = _best_of(lambda: list(correlate(image, subset, "opencv")))
+            cold_time = _best_of(lambda: list(FFTCorrelator(subset).match(image)))
+            correlator = FFTCorrelator(subset)
+            list(correlator.match(image))
+            warm_time = _best_of(lambda: list(correlator.match(image)))
+
+            reference = dict(correlate(image, subset, "opencv"))
+            drift = max((float(np.abs(scores - reference[i]).max()) for i, scores in correlator.match(image)), default=0.0)
+            winner = "fft" if warm_time < opencv_time else "opencv"
+            print(f"{f'{width}x{height}':<12}{count:>6}{opencv_time * 1000:>12.1f}{cold_time * 1000:>12.1f}"
+                  f"{warm_time * 1000:>12.1f}{winner:>10}{drift:>12.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+执行后端基准：对比 process / thread / serial / auto 四种执行后端
+- 场景: 未锁定分区整帧匹配（full）、锁定分区按区域匹配（full）、锁定分区节点窗口匹配（lattice）
+- 每帧延迟取中位数；CPU 时间为本进程与进程池工作进程的用户态 + 内核态时间之和
+  （工作进程的 CPU 时间读取 /proc，非 Linux 平台只统计本进程）
+- 检查各后端结果与 serial 一致
+
+用法: python -m benchmarks.bench_executors
+"""
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+
+import cv2
+
+from game_analyzer import GameAnalyzer
+from vision.executors import EXECUTOR_BACKENDS
+
+SAMPLES = sorted(Path("pictures/qipan").glob("*.png"))
+REGIONS_FILE = Path("data/regions.json")
+THRESHOLD = 0.8
+ROUNDS = 5
+SCENARIOS = (("整帧", False, "full"), ("区域", True, "full"), ("节点", True, "lattice"))
+
+
+def _cpu_seconds(analyzer: GameAnalyzer) -> float:
+    times = os.times()
+    total = times.user + times.system
+    pids = analyzer.pool.worker_pids() if hasattr(analyzer.pool, "worker_pids") else []
+    ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+    for pid in pids:
+        try:
+            fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        total += (int(fields[11]) + int(fields[12])) / ticks
+    return total
+
+
+def _run(analyzer: GameAnalyzer, frame, mode: str):
+    # 关闭跨帧缓存，每轮都是完整识别
+    analyzer.incremental = False
+    analyzer.crop_cache = None
+    timings = []
+    cpu_start = _cpu_seconds(analyzer)
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        detections = analyzer.analyze_screenshot(frame, THRESHOLD, return_detections=True, detection_mode=mode)
+        timings.append(time.perf_counter() - start)
+    cpu = (_cpu_seconds(analyzer) - cpu_start) / ROUNDS
+    keys = sorted(zip(detections.template_ids.tolist(), map(tuple, detections.boxes.tolist())))
+    return statistics.median(timings), cpu, keys
+
+
+def main():
+    regions = json.loads(REGIONS_FILE.read_text())
+    frames = [(sample.name, cv2.imread(str(sample))) for sample in SAMPLES]
+    results = {}
+    for kind in EXECUTOR_BACKENDS:
+        analyzer = GameAnalyzer("vision/new_templates", executor=kind)
+        for scenario, locked, mode in SCENARIOS:
+            analyzer.lock_regions(regions if locked else None)
+            for name, frame in frames:
+                results[(kind, scenario, name)] = _run(analyzer, frame, mode)
+        analyzer.pool.close()
+
+    print(f"CPU 核数: {os.cpu_count()}")
+    print(f"{'场景':<6}{'截图':<28}" + "".join(f"{kind + '(ms)':>14}{'CPU(ms)':>10}" for kind in EXECUTOR_BACKENDS) + f"{'结果一致':>10}")
+    for scenario, _, _ in SCENARIOS:
+        for name, _ in frames:
+            row = [results[(kind, scenario, name)] for kind in EXECUTOR_BACKENDS]
+            same = all(keys == row[EXECUTOR_BACKENDS.index("serial")][2] for _, _, keys in row)
+            print(f"{scenario:<6}{name:<28}" + "".join(f"{latency * 1000:>14.1f}{cpu * 1000:>10.1f}" for latency, cpu, _ in row)
+                  + f"{str(same):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+帧传输基准：对比 "任务元组内直接携带截图" 与 "共享内存环形缓冲区 + 句柄" 两种方式
+- 每帧 IPC 字节数（pickle 后的任务大小 x 颜色数）
+- 模板负载：任务内携带编译模板对象 vs 共享图集 + 模板 ID
+- Pool.map 往返耗时（工作进程只读取整帧，隔离传输开销）
+
+用法: python -m benchmarks.bench_frame_transport
+"""
+import pickle
+import time
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from vision.shm_transport import SharedFrameRing, TemplateAtlas, attach_frame
+from vision.templates_manager import TemplatesManager
+
+SAMPLES = sorted(Path("pictures/qipan").glob("*.png"))
+COLORS = 4
+ROUNDS = 20
+
+
+def _touch_inline(args):
+    frame, _ = args
+    return int(frame[::64, ::64].sum())
+
+
+def _touch_shared(args):
+    handle, _ = args
+    frame = attach_frame(handle)
+    return int(frame[::64, ::64].sum())
+
+
+def main():
+    frame = cv2.imread(str(SAMPLES[0]))
+    ring = SharedFrameRing(slots=2)
+    handle = ring.publish(frame)
+
+    inline_bytes = len(pickle.dumps((frame, "blue"))) * COLORS
+    shared_bytes = len(pickle.dumps((handle, "blue"))) * COLORS
+    print(f"帧尺寸: {frame.shape[1]}x{frame.shape[0]}")
+    print(f"每帧 IPC (内联截图):   {inline_bytes / 1024:10.1f} KiB")
+    print(f"每帧 IPC (共享内存):   {shared_bytes / 1024:10.1f} KiB  (缩减 {inline_bytes / shared_bytes:.0f}x)")
+
+    manager = TemplatesManager("vision/new_templates", color_ranges={
+        'blue':   {'lower': [100, 80, 80], 'upper': [130, 255, 255]},
+        'green':  {'lower': [35, 40, 40], 'upper': [95, 255, 255]},
+        'orange': {'lower': [5, 150, 150], 'upper': [20, 255, 255]},
+        'purple': {'lower': [135, 80, 80], 'upper': [160, 255, 255]}
+    })
+    bank = manager.bank
+    atlas = TemplateAtlas.build(bank.entries)
+    object_bytes = sum(len(pickle.dumps(bank.for_color(c))) for c in bank.colors())
+    id_bytes = sum(len(pickle.dumps((atlas.name, bank.ids_for_color(c)))) for c in bank.colors())
+    print(f"每帧模板负载 (模板对象): {object_bytes / 1024:8.1f} KiB")
+    print(f"每帧模板负载 (图集+ID):  {id_bytes / 1024:8.1f} KiB  (图集共享内存 {atlas.shm.size / 1024:.1f} KiB，全部进程共用一份)")
+    atlas.close()
+
+    with Pool(processes=cpu_count()) as pool:
+        pool.map(_touch_inline, [(frame, c) for c in range(COLORS)])
+        pool.map(_touch_shared, [(handle, c) for c in range(COLORS)])
+
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            pool.map(_touch_inline, [(frame, c) for c in range(COLORS)])
+        inline_ms = (time.perf_counter() - start) / ROUNDS * 1000
+
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            h = ring.publish(frame)
+            pool.map(_touch_shared, [(h, c) for c in range(COLORS)])
+        shared_ms = (time.perf_counter() - start) / ROUNDS * 1000
+
+    ring.close()
+    print(f"Pool.map 往返 (内联截图): {inline_ms:8.2f} ms/帧")
+    print(f"Pool.map 往返 (共享内存): {shared_ms:8.2f} ms/帧 (含发布拷贝)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+NMS 基准与一致性校验
+- 与原 standard_non_max_suppression（逐对比较的纯 Python 实现）逐一比对保留集，不一致即断言失败
+- 与原 vision.utils.non_max_suppression（闭区间像素约定）比对
+- 报告候选数增长时的耗时，验证网格 NMS 近似线性
+
+用法: python -m benchmarks.bench_nms
+"""
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from vision.utils import grid_nms, non_max_suppression
+
+TEMPLATE_SIZES = [(38, 28), (28, 38), (28, 36), (36, 28)]
+
+
+def reference_nms(boxes, scores, iou_threshold):
+    """原 game_analyzer.standard_non_max_suppression 的算法（按下标返回）"""
+    detections = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    keep = []
+    while detections:
+        best = detections.pop(0)
+        keep.append(best)
+        bx1, by1, bx2, by2 = boxes[best]
+        remaining = []
+        for other in detections:
+            ox1, oy1, ox2, oy2 = boxes[other]
+            intersection = max(0, min(bx2, ox2) - max(bx1, ox1)) * max(0, min(by2, oy2) - max(by1, oy1))
+            union = (bx2 - bx1) * (by2 - by1) + (ox2 - ox1) * (oy2 - oy1) - intersection
+            iou = intersection / union if union > 0 else 0
+            if iou < iou_threshold:
+                remaining.append(other)
+        detections = remaining
+    return keep
+
+
+def reference_inclusive_nms(boxes: List[Tuple[int, int, int, int]],
+                            scores: List[float],
+                            iou_threshold: float = 0.3) -> List[int]:
+    """原 vision.utils.non_max_suppression（逐字复制，未作修改）"""
+    if len(boxes) == 0:
+        return []
+
+    boxes = np.array(boxes)
+    scores = np.array(scores)
+
+    # 转换为 (x, y, w, h) 格式
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = boxes[:, 2]
+    y2 = boxes[:, 3]
+
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+
+        w = np.maximum(0, xx2 - xx1 + 1)
+        h = np.maximum(0, yy2 - yy1 + 1)
+
+        inter = w * h
+        union = areas[i] + areas[order[1:]] - inter
+        iou = inter / union
+
+        inds = np.where(iou <= iou_threshold)[0]
+        order = order[inds + 1]
+
+    return keep
+
+
+def make_candidates(n, rng, width=1024, height=738):
+    """模拟 matchTemplate 候选：围绕若干真实棋子位置的密集平台 + 零散误检，分数含大量并列"""
+    centers = rng.integers(0, [width - 40, height - 40], size=(max(n // 50, 1), 2))
+    pick = rng.integers(0, len(centers), size=n)
+    xy = centers[pick] + rng.integers(-6, 7, size=(n, 2))
+    noise = rng.random(n) < 0.1
+    xy[noise] = rng.integers(0, [width - 40, height - 40], size=(int(noise.sum()), 2))
+    sizes = np.array(TEMPLATE_SIZES)[rng.integers(0, len(TEMPLATE_SIZES), size=n)]
+    boxes = np.concatenate([xy, xy + sizes], axis=1)
+    scores = np.round(rng.uniform(0.6, 1.0, size=n), 2).astype(np.float32)
+    return boxes, scores
+
+
+def check_parity(rng, rounds=30):
+    for r in range(rounds):
+        boxes, scores = make_candidates(int(rng.integers(1, 800)), rng)
+        for thr in (0.1, 0.3, 0.5, 0.9):
+            expected = reference_nms(boxes.tolist(), scores.tolist(), thr)
+            assert grid_nms(boxes, scores, thr).tolist() == expected, f"保留集不一致 (round={r}, thr={thr})"
+            expected = [int(i) for i in reference_inclusive_nms(boxes.tolist(), scores.tolist(), thr)]
+            assert non_max_suppression(boxes.tolist(), scores.tolist(), thr) == expected, f"闭区间保留集不一致 (round={r}, thr={thr})"
+    print(f"一致性校验通过：{rounds} 组随机候选 x 4 个阈值，保留集与原实现完全相同。")
+
+
+def main():
+    rng = np.random.default_rng(0)
+    check_parity(rng)
+
+    print(f"{'候选数':>8} {'原实现(ms)':>12} {'网格NMS(ms)':>12}")
+    for n in (500, 2000, 8000, 32000):
+        boxes, scores = make_candidates(n, rng)
+        box_list, score_list = boxes.tolist(), scores.tolist()
+        if n <= 2000:
+            start = time.perf_counter()
+            reference_nms(box_list, score_list, 0.3)
+            ref_ms = f"{(time.perf_counter() - start) * 1000:12.1f}"
+        else:
+            ref_ms = f"{'(跳过)':>12}"
+        start = time.perf_counter()
+        grid_nms(boxes, scores, 0.3)
+        grid_ms = (time.perf_counter() - start) * 1000
+        print(f"{n:>8} {ref_ms} {grid_ms:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+方向路由基准：对比 "所有方向模板全图匹配" 与 "按锁定分区只匹配对应方向模板"
+- 每帧 matchTemplate 调用次数与匹配面积（模板数 x 搜索区域像素）
+- 每帧检测耗时（取中位数）
+- 两种路径的检测结果是否一致
+
+分区读取自 data/regions.json，截图取 pictures/qipan/*.png。
+用法: python -m benchmarks.bench_orientation_routing
+"""
+import json
+import statistics
+import time
+from pathlib import Path
+
+import cv2
+
+from game_analyzer import GameAnalyzer
+from game_model import REGION_ORIENTATIONS
+
+SAMPLES = sorted(Path("pictures/qipan").glob("*.png"))
+REGIONS_FILE = Path("data/regions.json")
+ROUNDS = 5
+THRESHOLD = 0.8
+
+
+def _workload(analyzer: GameAnalyzer, frame_shape) -> tuple:
+    """与 GameAnalyzer._detect 相同的任务划分下的 (matchTemplate 次数, 搜索像素总量)"""
+    bank = analyzer.templates_manager.bank
+    img_h, img_w = frame_shape[:2]
+    calls = area = 0
+    for color in bank.colors():
+        for region, roi in analyzer._region_rois(frame_shape, (0, 0)):
+            count = len(bank.ids_for_color(color, orientations=REGION_ORIENTATIONS.get(region)))
+            w, h = (roi[2], roi[3]) if roi is not None else (img_w, img_h)
+            calls += count
+            area += count * w * h
+    return calls, area
+
+
+def _timed(analyzer: GameAnalyzer, frame) -> tuple:
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        detections = analyzer.analyze_screenshot(frame, THRESHOLD, return_detections=True, detection_mode="full")
+        timings.append(time.perf_counter() - start)
+    keys = set(zip(detections.template_ids.tolist(), map(tuple, detections.boxes.tolist())))
+    return statistics.median(timings), keys
+
+
+def main():
+    analyzer = GameAnalyzer("vision/new_templates")
+    analyzer.lock_regions(json.loads(REGIONS_FILE.read_text()))
+
+    print(f"{'截图':<28}{'路径':<8}{'调用次数':>10}{'匹配面积(Mpx)':>16}{'耗时(ms)':>12}")
+    for sample in SAMPLES:
+        frame = cv2.imread(str(sample))
+        results = {}
+        for label, routing in (("全方向", False), ("路由", True)):
+            analyzer.orientation_routing = routing
+            calls, area = _workload(analyzer, frame.shape)
+            elapsed, keys = _timed(analyzer, frame)
+            results[label] = (calls, area, elapsed, keys)
+            print(f"{sample.name:<28}{label:<8}{calls:>10}{area / 1e6:>16.1f}{elapsed * 1000:>12.1f}")
+        (base_calls, base_area, base_time, base_keys), (calls, area, elapsed, keys) = results.values()
+        print(f"{'':<28}{'缩减':<8}{base_calls / calls:>9.2f}x{base_area / area:>15.2f}x{base_time / elapsed:>11.2f}x"
+              f"  结果一致: {keys == base_keys}")
+
+
+if __name__ == "__main__":
+    main()
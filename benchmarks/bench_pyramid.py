@@ -0,0 +1,57 @@
+"""
+金字塔匹配基准：对比 "full" 全分辨率匹配与 "pyramid" 两级金字塔匹配
+- 每帧检测耗时（取中位数），分别在未锁定分区（整帧）与锁定分区（方向路由）下测量
+- 与全分辨率结果的一致性：召回率 / 精确率（按 模板ID + 左上角 比较），以及分数最大偏差
+
+用法: python -m benchmarks.bench_pyramid
+"""
+import json
+import statistics
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from game_analyzer import GameAnalyzer
+
+SAMPLES = sorted(Path("pictures/qipan").glob("*.png"))
+REGIONS_FILE = Path("data/regions.json")
+THRESHOLDS = (0.8, 0.6)
+ROUNDS = 3
+
+
+def _run(analyzer: GameAnalyzer, frame, threshold: float, mode: str):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        detections = analyzer.analyze_screenshot(frame, threshold, return_detections=True, detection_mode=mode)
+        timings.append(time.perf_counter() - start)
+    found = {(tid, x, y): score for tid, (x, y), score in
+             zip(detections.template_ids.tolist(), detections.boxes[:, :2].tolist(), detections.scores.tolist())}
+    return statistics.median(timings), found
+
+
+def main():
+    analyzer = GameAnalyzer("vision/new_templates")
+    print(f"粗匹配阈值: {analyzer.pyramid_coarse_threshold}  缩小倍数: {analyzer.pyramid_factor}  "
+          f"确认半径: {analyzer.pyramid_refine_radius}")
+    print(f"{'分区':<6}{'截图':<28}{'阈值':>6}{'full(ms)':>10}{'pyramid(ms)':>13}{'加速':>8}{'召回':>8}{'精确':>8}{'分数偏差':>10}")
+    for locked in (False, True):
+        if locked:
+            analyzer.lock_regions(json.loads(REGIONS_FILE.read_text()))
+        for sample in SAMPLES:
+            frame = cv2.imread(str(sample))
+            for threshold in THRESHOLDS:
+                full_time, full = _run(analyzer, frame, threshold, "full")
+                pyramid_time, pyramid = _run(analyzer, frame, threshold, "pyramid")
+                common = full.keys() & pyramid.keys()
+                recall = len(common) / len(full) if full else 1.0
+                precision = len(common) / len(pyramid) if pyramid else 1.0
+                drift = max((abs(full[k] - pyramid[k]) for k in common), default=0.0)
+                print(f"{'锁定' if locked else '整帧':<6}{sample.name:<28}{threshold:>6.2f}{full_time * 1000:>10.1f}"
+                      f"{pyramid_time * 1000:>13.1f}{full_time / pyramid_time:>7.2f}x{recall:>8.3f}{precision:>8.3f}{drift:>10.2e}")
+
+
+if __name__ == "__main__":
+    main()
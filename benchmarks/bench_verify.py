@@ -0,0 +1,94 @@
+"""
+先验复核基准："verify" 模式与 "lattice" 模式对比
+- 静止帧: 连续两帧相同截图（关闭增量识别，所有节点都走复核），第二帧的耗时、通过复核的节点数，
+  以及结果是否与 lattice 一致
+- 换子: 把一个节点上的棋子换成同颜色、同方向的另一种棋子（在原检测框处贴上该模板），
+  统计 verify 模式仍沿用旧标签的次数；lattice 模式作为对照
+
+用法: python -m benchmarks.bench_verify
+"""
+import json
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from game_analyzer import GameAnalyzer
+
+SAMPLES = (Path("pictures/qipan/1.png"), Path("pictures/qipan/2.png"))
+REGIONS_FILE = Path("data/regions.json")
+THRESHOLDS = (0.6, 0.8)
+SWAPS_PER_SAMPLE = 60
+
+
+def _keys(detections):
+    return sorted(zip(detections.node_ids.tolist(), detections.template_ids.tolist()))
+
+
+def _label_at(detections, node: int):
+    index = np.flatnonzero(detections.node_ids == node)
+    return detections.piece_types[index[0]] if len(index) else None
+
+
+def _static(analyzer: GameAnalyzer, frame, threshold: float):
+    analyzer.incremental = False
+    analyzer._incremental_state = None
+    lattice = analyzer.analyze_screenshot(frame, threshold, return_detections=True, detection_mode="lattice")
+    analyzer._incremental_state = None
+    analyzer.analyze_screenshot(frame, threshold, return_detections=True, detection_mode="verify")
+    start = time.perf_counter()
+    verify = analyzer.analyze_screenshot(frame, threshold, return_detections=True, detection_mode="verify")
+    elapsed = time.perf_counter() - start
+    analyzer.incremental = True
+    return elapsed, analyzer.last_verified_count, _keys(verify) == _keys(lattice)
+
+
+def _swaps(analyzer: GameAnalyzer, frame, threshold: float, rng):
+    """返回 (换子次数, verify 沿用旧标签次数, lattice 标错次数)"""
+    bank = analyzer.templates_manager.bank
+    analyzer._incremental_state = None
+    before = analyzer.analyze_screenshot(frame, threshold, return_detections=True, detection_mode="verify")
+    state = analyzer._incremental_state
+    stale = wrong = 0
+    picks = rng.choice(len(before), size=min(SWAPS_PER_SAMPLE, len(before)), replace=False)
+    for index in picks:
+        old = bank.entries[int(before.template_ids[index])].template
+        node = int(before.node_ids[index])
+        siblings = [i for i in bank.ids_for_color(old.color, orientations=(old.orientation,))
+                    if bank.entries[i].template.piece_type != old.piece_type]
+        new = bank.entries[int(rng.choice(siblings))].template
+        x, y = before.boxes[index, :2].tolist()
+        h, w = new.image.shape[:2]
+        swapped = frame.copy()
+        swapped[y:y + h, x:x + w] = new.image
+
+        analyzer._incremental_state = state
+        verify = analyzer.analyze_screenshot(swapped, threshold, return_detections=True, detection_mode="verify")
+        analyzer._incremental_state = None
+        lattice = analyzer.analyze_screenshot(swapped, threshold, return_detections=True, detection_mode="lattice")
+        stale += _label_at(verify, node) == old.piece_type
+        wrong += _label_at(lattice, node) != new.piece_type
+    return len(picks), stale, wrong
+
+
+def main():
+    analyzer = GameAnalyzer("vision/new_templates", executor="serial")
+    analyzer.lock_regions(json.loads(REGIONS_FILE.read_text()))
+    # 关闭内容缓存，换子帧之间互不影响
+    analyzer.crop_cache = None
+    rng = np.random.default_rng(0)
+    print(f"复核阈值: {analyzer.verify_threshold or f'同组最相似模板 + {analyzer.verify_margin}'}")
+    print(f"{'截图':<8}{'阈值':>6}{'静止帧(ms)':>12}{'复核通过':>10}{'与lattice一致':>14}{'换子':>6}{'verify沿用旧标签':>18}{'lattice标错':>12}")
+    for sample in SAMPLES:
+        frame = cv2.imread(str(sample))
+        for threshold in THRESHOLDS:
+            elapsed, verified, same = _static(analyzer, frame, threshold)
+            swaps, stale, wrong = _swaps(analyzer, frame, threshold, rng)
+            print(f"{sample.name:<8}{threshold:>6.2f}{elapsed * 1000:>12.1f}{verified:>10}{str(same):>14}"
+                  f"{swaps:>6}{stale:>18}{wrong:>12}")
+    analyzer.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,273 @@
 import cv2
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Iterator, Sequence, Union, Optional
 from collections import Counter
 from sklearn.cluster import KMeans
 from dataclasses import dataclass
-from multiprocessing import Pool, cpu_count
+from collections import OrderedDict
+import math
+import time
+import functools
+import threading
+from contextlib import contextmanager
+from multiprocessing import cpu_count
 
 # --- 导入核心模块 ---
-from vision.templates_manager import TemplatesManager
+from vision.templates_manager import TemplatesManager, TemplateBank
+from vision.shm_transport import SharedFrameRing, TemplateAtlas, attach_frame, attach_atlas, use_atlas
+from vision.utils import find_peaks, grid_nms, build_hsv_label_luts, hsv_label_image
+from vision.correlation import FFTCorrelator, correlate
+from vision.crop_cache import CropCache
+from vision.executors import create_executor
+from vision.buffer_arena import BufferArena, thread_arena
+from vision.scheduling import TaskCostModel, balance_tasks, chunk_units, pad_strips, split_rows, target_task_cost
+from game_model import LatticeNode, build_lattice, estimate_board_scale, REGION_ORIENTATIONS
 
 # ==============================================================================
 # --- 并行处理工作函数 (必须定义在顶层) ---
 # ==============================================================================
-def _parallel_worker(args):
-    image, templates, color_ranges, threshold, color_name = args
-    results = []
-    hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    lower_bound = np.array(color_ranges[color_name]['lower'])
-    upper_bound = np.array(color_ranges[color_name]['upper'])
-    mask = cv2.inRange(hsv_image, lower_bound, upper_bound)
-    gray_masked_image = cv2.bitwise_and(image, image, mask=mask)
-    gray_masked_image = cv2.cvtColor(gray_masked_image, cv2.COLOR_BGR2GRAY)
-
-    for template in templates:
-        hsv_template = cv2.cvtColor(template.image, cv2.COLOR_BGR2HSV)
-        template_mask = cv2.inRange(hsv_template, lower_bound, upper_bound)
-        masked_template = cv2.bitwise_and(template.image, template.image, mask=template_mask)
-        gray_masked_template = cv2.cvtColor(masked_template, cv2.COLOR_BGR2GRAY)
-
-        if gray_masked_template.shape[0] > gray_masked_image.shape[0] or \
-           gray_masked_template.shape[1] > gray_masked_image.shape[1] or \
-           np.sum(gray_masked_template) == 0:
+def _init_worker(atlas_name: str):
+    """
+    进程池初始化：每个工作进程预先附加一次共享模板图集。
+    线程池的线程按需创建，切换比例后才启动的线程拿到的旧图集可能已关闭，此时由首个任务按新名字附加。
+    """
+    try:
+        attach_atlas(atlas_name)
+    except FileNotFoundError:
+        pass
+
+def _masked_gray(planes: np.ndarray, label: int, arena: Optional[BufferArena] = None) -> np.ndarray:
+    """
+    由 (灰度, 颜色标签) 双平面得到某颜色的掩码灰度图。
+    等价于先 HSV inRange 掩码 BGR 再转灰度（与模板编译时的处理一致），但 HSV 转换每帧只在父进程做一次。
+    传入 arena 时掩码与结果写入其缓冲区（下一次调用前有效）。
+    """
+    gray, labels = planes[0], planes[1]
+    shape = gray.shape
+    mask = cv2.compare(labels, label, cv2.CMP_EQ, dst=arena.get("mask", shape) if arena else None)
+    # 掩码取值 0/255，按位与即保留掩码内灰度、其余置 0（写入复用缓冲区时不能用 mask 参数，掩码外不会被清零）
+    return cv2.bitwise_and(gray, mask, dst=arena.get("masked", shape) if arena else None)
+
+# 工作进程内缓存的 FFT 相关器（含按 ROI 尺寸缓存的模板频谱），按字节数上限淘汰最久未用的
+_FFT_CACHE_BYTES = 256 * 1024 * 1024
+_fft_correlators: "OrderedDict[Tuple, FFTCorrelator]" = OrderedDict()
+_fft_lock = threading.Lock()
+
+def _worker_correlator(atlas, template_ids: Sequence[int]) -> FFTCorrelator:
+    key = (atlas.name, tuple(template_ids))
+    with _fft_lock:
+        correlator = _fft_correlators.get(key)
+        if correlator is None:
+            correlator = FFTCorrelator([atlas.image(template_id) for template_id in template_ids])
+            _fft_correlators[key] = correlator
+        _fft_correlators.move_to_end(key)
+        while len(_fft_correlators) > 1 and sum(c.nbytes for c in _fft_correlators.values()) > _FFT_CACHE_BYTES:
+            _fft_correlators.popitem(last=False)
+    return correlator
+
+# 级联放行区域按 _CASCADE_TILE 像素分块合并，减少小窗口 matchTemplate 的调用开销；
+# 放行块覆盖超过 _CASCADE_MAX_COVERAGE 时直接算完整得分图（裁剪已无收益）
+_CASCADE_TILE = 32
+_CASCADE_MAX_COVERAGE = 0.5
+# 行条带上下各多带的得分图行数：find_peaks 默认 3x3 邻域，判定边缘行是否为局部极大值需要相邻 1 行
+_PEAK_CONTEXT = 1
+
+def _cascade_windows(passed: np.ndarray) -> Optional[np.ndarray]:
+    """代表放行掩码 -> 需要计算成员得分的矩形 (x, y, w, h)（得分图坐标）；覆盖过大时返回 None"""
+    out_h, out_w = passed.shape
+    tiles = np.maximum.reduceat(np.maximum.reduceat(passed, np.arange(0, out_h, _CASCADE_TILE), axis=0),
+                                np.arange(0, out_w, _CASCADE_TILE), axis=1)
+    if np.count_nonzero(tiles) > _CASCADE_MAX_COVERAGE * tiles.size:
+        return None
+    count, _, stats, _ = cv2.connectedComponentsWithStats(tiles, connectivity=8)
+    windows = stats[1:, :4] * _CASCADE_TILE
+    windows[:, 2] = np.minimum(windows[:, 2], out_w - windows[:, 0])
+    windows[:, 3] = np.minimum(windows[:, 3], out_h - windows[:, 1])
+    return windows
+
+def _cascade_correlate(image: np.ndarray, atlas, clusters, arena: BufferArena) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    相似模板级联匹配，逐个产出 (模板 ID, 得分图)
+    先算簇代表的完整得分图；其余成员只在代表得分达到放行阈值的分块内匹配，块外得分记为 -1。
+    放行阈值由簇半径推出（见 TemplateCluster），被剔除位置的成员得分必然低于匹配阈值。
+    得分图写入 arena 的缓冲区，产出的得分图在下一次产出前有效。
+    """
+    img_h, img_w = image.shape[:2]
+    for representative, members, representative_threshold in clusters:
+        template_h, template_w = atlas.image(representative).shape
+        if template_h > img_h or template_w > img_w:
+            continue
+        out_shape = (img_h - template_h + 1, img_w - template_w + 1)
+        representative_map = cv2.matchTemplate(image, atlas.image(representative), cv2.TM_CCOEFF_NORMED,
+                                               result=arena.get("representative", out_shape, np.float32))
+        yield representative, representative_map
+        if len(members) == 1:
+            continue
+        passed = cv2.compare(representative_map, representative_threshold, cv2.CMP_GE, dst=arena.get("passed", out_shape))
+        windows = _cascade_windows(passed)
+        if windows is not None and len(windows) == 0:
+            continue
+        for member in members:
+            if member == representative:
+                continue
+            member_map = arena.get("member", out_shape, np.float32)
+            if windows is None:
+                yield member, cv2.matchTemplate(image, atlas.image(member), cv2.TM_CCOEFF_NORMED, result=member_map)
+                continue
+            member_map.fill(-1.0)
+            for x, y, w, h in windows:
+                window = image[y:y + h + template_h - 1, x:x + w + template_w - 1]
+                member_map[y:y + h, x:x + w] = cv2.matchTemplate(window, atlas.image(member), cv2.TM_CCOEFF_NORMED)
+            yield member, member_map
+
+def _with_atlas(worker):
+    """工作函数执行期间占用任务指定的图集（args[1]），见 shm_transport.use_atlas"""
+    @functools.wraps(worker)
+    def run(args):
+        with use_atlas(args[1]) as atlas:
+            return worker(args, atlas)
+    return run
+
+@_with_atlas
+def _parallel_worker(args, atlas):
+    frame_handle, atlas_name, template_ids, label, threshold, max_peaks, roi, rows, backend, clusters = args
+    # 帧（灰度 + 颜色标签）与模板都通过共享内存传递，这里只附加映射，不发生拷贝
+    planes = attach_frame(frame_handle)
+    # roi 为 (x, y, w, h) 时只匹配该区域，结果换算回帧坐标
+    roi_x, roi_y = 0, 0
+    if roi is not None:
+        roi_x, roi_y, roi_w, roi_h = roi
+        planes = planes[:, roi_y:roi_y + roi_h, roi_x:roi_x + roi_w]
+    # 掩码图、得分图与峰值检测的中间结果都写入本线程的复用缓冲区，每帧不再重新分配
+    arena = thread_arena()
+    gray_masked_image = _masked_gray(planes, label, arena)
+
+    # 模板侧的掩码/灰度化已在 TemplatesManager.compile_bank 中预先完成
+    # clusters 非空时按相似模板层级级联匹配（仅 opencv 后端）；否则逐模板计算完整得分图
+    if clusters:
+        scored = _cascade_correlate(gray_masked_image, atlas, clusters, arena)
+    else:
+        correlator = _worker_correlator(atlas, template_ids) if backend == "fft" else None
+        templates = [atlas.image(template_id) for template_id in template_ids]
+        scored = ((template_ids[slot], match_result)
+                  for slot, match_result in correlate(gray_masked_image, templates, backend, correlator, arena))
+    chunks = []
+    for template_id, match_result in scored:
+        # 行条带任务（rows 非空）的 roi 带有上下文行：只保留本条负责的行，max_peaks 由父进程对各条带的并集统一截取
+        xs, ys, scores = find_peaks(match_result, threshold, max_peaks if rows is None else None,
+                                    scratch=arena.get("dilated", match_result.shape, np.float32))
+        if rows is not None:
+            keep = (ys + roi_y >= rows[0]) & (ys + roi_y < rows[1])
+            xs, ys, scores = xs[keep], ys[keep], scores[keep]
+        if len(xs) == 0: continue
+
+        chunk = np.empty(len(xs), dtype=MATCH_DTYPE)
+        chunk['template_id'] = template_id; chunk['x'] = xs + roi_x; chunk['y'] = ys + roi_y; chunk['score'] = scores
+        chunks.append(chunk)
+
+    # 峰值以紧凑数组形式传回父进程。不做本地 NMS：贪心 NMS 不满足结合律，本地先筛会让保留集随任务划分
+    # （取决于核数与代价模型）变化；父进程对全部任务的峰值只做一次 NMS
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=MATCH_DTYPE)
+
+@_with_atlas
+def _pyramid_worker(args, atlas):
+    """
+    两级金字塔匹配：先用缩小的模板在缩小的掩码灰度图上以放宽的阈值找候选，
+    再只在每个候选周围的小窗口内用全分辨率模板确认。
+    粗模板在图集中的 ID 为 原模板 ID + coarse_offset。
+    """
+    (frame_handle, atlas_name, template_ids, label, threshold, max_peaks, roi,
+     coarse_offset, factor, coarse_threshold, refine_radius) = args
+    planes = attach_frame(frame_handle)
+    roi_x, roi_y = 0, 0
+    if roi is not None:
+        roi_x, roi_y, roi_w, roi_h = roi
+        planes = planes[:, roi_y:roi_y + roi_h, roi_x:roi_x + roi_w]
+    # 先在全分辨率下掩码（掩码决定笔画形状），再缩小，与粗模板的生成方式一致
+    arena = thread_arena()
+    gray_masked_image = _masked_gray(planes, label, arena)
+    img_h, img_w = gray_masked_image.shape[:2]
+    coarse_image = cv2.resize(gray_masked_image, (img_w // factor, img_h // factor), interpolation=cv2.INTER_AREA,
+                              dst=arena.get("coarse", (img_h // factor, img_w // factor)))
+
+    chunks = []
+    for template_id in template_ids:
+        coarse_template = atlas.image(template_id + coarse_offset)
+        if coarse_template.shape[0] > coarse_image.shape[0] or coarse_template.shape[1] > coarse_image.shape[1]:
             continue
+        coarse_shape = (coarse_image.shape[0] - coarse_template.shape[0] + 1, coarse_image.shape[1] - coarse_template.shape[1] + 1)
+        coarse_result = cv2.matchTemplate(coarse_image, coarse_template, cv2.TM_CCOEFF_NORMED,
+                                          result=arena.get("score", coarse_shape, np.float32))
+        cxs, cys, _ = find_peaks(coarse_result, coarse_threshold, None if max_peaks is None else 2 * max_peaks,
+                                 scratch=arena.get("dilated", coarse_shape, np.float32))
+        if len(cxs) == 0: continue
+
+        gray_masked_template = atlas.image(template_id)
+        th, tw = gray_masked_template.shape[:2]
+        found = []
+        for cx, cy in zip(cxs, cys):
+            x1 = max(int(cx) * factor - refine_radius, 0); y1 = max(int(cy) * factor - refine_radius, 0)
+            x2 = min(int(cx) * factor + refine_radius + factor + tw, img_w); y2 = min(int(cy) * factor + refine_radius + factor + th, img_h)
+            if x2 - x1 < tw or y2 - y1 < th: continue
+            match_result = cv2.matchTemplate(gray_masked_image[y1:y2, x1:x2], gray_masked_template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (bx, by) = cv2.minMaxLoc(match_result)
+            if score >= threshold:
+                found.append((template_id, x1 + bx + roi_x, y1 + by + roi_y, score))
+        if found:
+            chunks.append(np.array(found, dtype=MATCH_DTYPE))
+
+    # 相邻粗候选可能确认到同一位置，重复项由父进程的 NMS 去掉（同 _parallel_worker，不做本地 NMS）
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=MATCH_DTYPE)
 
-        match_result = cv2.matchTemplate(gray_masked_image, gray_masked_template, cv2.TM_CCOEFF_NORMED)
-        locations = np.where(match_result >= threshold)
+@_with_atlas
+def _lattice_worker(args, atlas):
+    """节点窗口模式：只在每个棋盘节点周围的小窗口内匹配，每个节点只返回本颜色的最佳模板"""
+    frame_handle, atlas_name, template_ids, label, threshold, nodes, windows = args
+    planes = attach_frame(frame_handle)
 
-        for pt in zip(*locations[::-1]):
-            confidence = match_result[pt[1], pt[0]]
-            results.append(DetectionResult(template=template, location=pt, confidence=confidence))
+    arena = thread_arena()
+    records = []
+    for node, (wx, wy, ww, wh) in zip(nodes, windows):
+        # 先筛掉放不进窗口的模板，没有可匹配的模板时不做掩码（空窗口无法掩码）
+        fitting = [template_id for template_id in template_ids
+                   if atlas.table[template_id, 1] <= wh and atlas.table[template_id, 2] <= ww]
+        if not fitting:
+            continue
+        gray_window = _masked_gray(planes[:, wy:wy + wh, wx:wx + ww], label, arena)
+        best = None
+        for template_id in fitting:
+            gray_masked_template = atlas.image(template_id)
+            result_shape = (wh - gray_masked_template.shape[0] + 1, ww - gray_masked_template.shape[1] + 1)
+            match_result = cv2.matchTemplate(gray_window, gray_masked_template, cv2.TM_CCOEFF_NORMED,
+                                             result=arena.get("score", result_shape, np.float32))
+            _, score, _, (bx, by) = cv2.minMaxLoc(match_result)
+            if score >= threshold and (best is None or score > best[4]):
+                best = (node, template_id, wx + bx, wy + by, score)
+        if best is not None:
+            records.append(best)
+    return np.array(records, dtype=NODE_MATCH_DTYPE)
+
+@_with_atlas
+def _verify_worker(args, atlas):
+    """先验复核：每个节点只用上一帧的模板在节点窗口内匹配一次，得分达到该节点的复核阈值即沿用该标签"""
+    frame_handle, atlas_name, labels, thresholds, priors, windows = args
+    planes = attach_frame(frame_handle)
 
-    return results
+    arena = thread_arena()
+    records = []
+    for label, threshold, prior, (wx, wy, ww, wh) in zip(labels, thresholds, priors, windows):
+        gray_masked_template = atlas.image(prior['template_id'])
+        if gray_masked_template.shape[0] > wh or gray_masked_template.shape[1] > ww:
+            continue
+        gray_window = _masked_gray(planes[:, wy:wy + wh, wx:wx + ww], label, arena)
+        result_shape = (wh - gray_masked_template.shape[0] + 1, ww - gray_masked_template.shape[1] + 1)
+        match_result = cv2.matchTemplate(gray_window, gray_masked_template, cv2.TM_CCOEFF_NORMED,
+                                         result=arena.get("score", result_shape, np.float32))
+        _, score, _, (bx, by) = cv2.minMaxLoc(match_result)
+        if score >= threshold:
+            records.append((prior['node'], prior['template_id'], wx + bx, wy + by, score))
+    return np.array(records, dtype=NODE_MATCH_DTYPE)
 
 # ==============================================================================
 # --- 核心算法模块 ---
@@ -68,25 +294,119 @@ class DetectionResult:
     def color(self) -> str:
         return self.template.color
 
+# 工作进程返回的紧凑匹配记录：(模板ID, 左上角x, 左上角y, 匹配分数)
+MATCH_DTYPE = np.dtype([('template_id', '<i4'), ('x', '<i4'), ('y', '<i4'), ('score', '<f4')])
+# 节点窗口模式的匹配记录，额外带节点下标
+NODE_MATCH_DTYPE = np.dtype([('node', '<i4'), ('template_id', '<i4'), ('x', '<i4'), ('y', '<i4'), ('score', '<f4')])
+
+def _best_per_node(records: np.ndarray) -> np.ndarray:
+    """NODE_MATCH_DTYPE 记录中每个节点只保留得分最高的一条（按节点排序；同分取模板ID最小的，与合并顺序无关）"""
+    if len(records) == 0: return records
+    records = records[np.lexsort((records['template_id'], -records['score'], records['node']))]
+    _, first = np.unique(records['node'], return_index=True)
+    return records[first]
+
+def _top_peaks(matches: np.ndarray, max_peaks: Optional[int]) -> np.ndarray:
+    """每个模板只保留得分最高的 max_peaks 个匹配（同分按 y、x 取舍），None 表示不限制"""
+    if max_peaks is None or len(matches) == 0: return matches
+    matches = matches[np.lexsort((matches['x'], matches['y'], -matches['score'], matches['template_id']))]
+    _, first, counts = np.unique(matches['template_id'], return_index=True, return_counts=True)
+    rank = np.arange(len(matches)) - np.repeat(first, counts)
+    return matches[rank < max_peaks]
+
+def _merge_matches(chunks: Sequence[np.ndarray]) -> np.ndarray:
+    """合并各任务返回的 MATCH_DTYPE 数组，按 (模板ID, y, x) 排序，使同分候选的 NMS 取舍与任务完成顺序无关"""
+    if not chunks: return np.empty(0, dtype=MATCH_DTYPE)
+    matches = np.concatenate(chunks)
+    return matches[np.lexsort((matches['x'], matches['y'], matches['template_id']))]
+
+def nms_matches(matches: np.ndarray, template_sizes: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """对 MATCH_DTYPE 数组做 NMS；template_sizes[模板ID] = (宽, 高)"""
+    if len(matches) == 0: return matches
+    sizes = template_sizes[matches['template_id']]
+    boxes = np.stack([matches['x'], matches['y'], matches['x'] + sizes[:, 0], matches['y'] + sizes[:, 1]], axis=1)
+    return matches[grid_nms(boxes, matches['score'], iou_threshold)]
+
+class DetectionBatch:
+    """
+    结构化数组形式的检测结果 (structure-of-arrays)
+    - boxes: (N, 4) int32，(x1, y1, x2, y2)
+    - scores / template_ids / colors / piece_types: 长度为 N 的平行数组
+    - node_ids: 节点窗口模式下每个检测对应的棋盘节点下标（其他模式为 None）
+    整个检测流程都以数组操作处理；只有旧接口逐个迭代时才按需生成 DetectionResult。
+    """
+
+    def __init__(self, boxes: np.ndarray, scores: np.ndarray, template_ids: np.ndarray, templates: Sequence,
+                 node_ids: Optional[np.ndarray] = None):
+        self.boxes = boxes
+        self.scores = scores
+        self.template_ids = template_ids
+        self.node_ids = node_ids
+        self.templates = templates  # 模板ID -> Template
+        colors = np.array([t.color for t in templates] or [''])
+        piece_types = np.array([t.piece_type for t in templates] or [''])
+        self.colors = colors[template_ids]
+        self.piece_types = piece_types[template_ids]
+
+    @classmethod
+    def from_matches(cls, matches: np.ndarray, templates: Sequence) -> 'DetectionBatch':
+        """由 MATCH_DTYPE 数组构建；templates[模板ID].shape = (宽, 高)"""
+        sizes = np.array([t.shape for t in templates] or [(0, 0)], dtype=np.int32)[matches['template_id']]
+        boxes = np.stack([matches['x'], matches['y'], matches['x'] + sizes[:, 0], matches['y'] + sizes[:, 1]], axis=1).astype(np.int32)
+        node_ids = matches['node'].astype(np.int32) if 'node' in matches.dtype.names else None
+        return cls(boxes, matches['score'].astype(np.float32), matches['template_id'].astype(np.int32), templates, node_ids)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def __getitem__(self, index: Union[int, slice, np.ndarray]) -> Union[DetectionResult, 'DetectionBatch']:
+        if isinstance(index, (int, np.integer)):
+            x1, y1 = self.boxes[index, :2]
+            return DetectionResult(template=self.templates[self.template_ids[index]], location=(int(x1), int(y1)), confidence=float(self.scores[index]))
+        return DetectionBatch(self.boxes[index], self.scores[index], self.template_ids[index], self.templates,
+                              None if self.node_ids is None else self.node_ids[index])
+
+    def __iter__(self) -> Iterator[DetectionResult]:
+        """兼容旧调用方：逐个生成 DetectionResult 视图"""
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def locations(self) -> np.ndarray:
+        return self.boxes[:, :2]
+
+    def filter(self, mask: np.ndarray) -> 'DetectionBatch':
+        return self[np.asarray(mask)]
+
+    def sort_by_score(self, descending: bool = True) -> 'DetectionBatch':
+        order = np.argsort(-self.scores if descending else self.scores, kind='stable')
+        return self[order]
+
+    def group_by_color(self) -> Dict[str, 'DetectionBatch']:
+        """按颜色分组，分组顺序为各颜色在批内首次出现的顺序"""
+        if len(self) == 0: return {}
+        colors, first_index, inverse = np.unique(self.colors, return_index=True, return_inverse=True)
+        return {str(colors[k]): self[inverse == k] for k in np.argsort(first_index)}
+
 def standard_non_max_suppression(detections: List[DetectionResult], iou_threshold: float) -> List[DetectionResult]:
     if not detections: return []
-    detections.sort(key=lambda x: x.confidence, reverse=True)
-    final_detections = []
-    while detections:
-        best = detections.pop(0)
-        final_detections.append(best)
-        remaining = []
-        for other in detections:
-            x1=max(best.bbox[0],other.bbox[0]); y1=max(best.bbox[1],other.bbox[1])
-            x2=min(best.bbox[2],other.bbox[2]); y2=min(best.bbox[3],other.bbox[3])
-            intersection=max(0,x2-x1)*max(0,y2-y1)
-            area_best=(best.bbox[2]-best.bbox[0])*(best.bbox[3]-best.bbox[1])
-            area_other=(other.bbox[2]-other.bbox[0])*(other.bbox[3]-other.bbox[1])
-            union=area_best+area_other-intersection
-            iou=intersection/union if union>0 else 0
-            if iou<iou_threshold: remaining.append(other)
-        detections=remaining
-    return final_detections
+    boxes = np.array([d.bbox for d in detections])
+    scores = np.array([d.confidence for d in detections], dtype=np.float64)
+    return [detections[i] for i in grid_nms(boxes, scores, iou_threshold)]
+
+@dataclass
+class IncrementalState:
+    """
+    增量识别缓存（节点窗口模式）
+    - key: 影响识别结果的参数（图集、节点窗口、阈值、预分类设置），变化即整帧重识别
+    - planes: 上一次识别的 (灰度, 颜色标签) 双平面
+    - records: 每个节点至多一条 NODE_MATCH_DTYPE 记录
+    - frames_since_full: 距上次完整识别的帧数
+    """
+    key: Tuple
+    planes: np.ndarray
+    records: np.ndarray
+    frames_since_full: int = 0
 
 # --- Constants for Piece Roster and Formatting ---
 FULL_ROSTER = {
@@ -100,58 +420,533 @@ COLOR_TAG_MAP = {
 }
 
 class GameAnalyzer:
-    def __init__(self, templates_path: str):
-        self.templates_manager = TemplatesManager(templates_path)
-        if not self.templates_manager.get_all_templates():
-            raise Exception("错误: 模板加载失败。")
+    def __init__(self, templates_path: str, detection_mode: str = "full", lattice_slack: int = 6,
+                 correlation_backend: str = "opencv", executor: str = "process"):
         self.hsv_color_ranges = {
             'blue':   {'lower': [100, 80, 80], 'upper': [130, 255, 255]},
             'green':  {'lower': [35, 40, 40], 'upper': [95, 255, 255]},
             'orange': {'lower': [5, 150, 150], 'upper': [20, 255, 255]},
             'purple': {'lower': [135, 80, 80], 'upper': [160, 255, 255]}
         }
+        # 颜色标签图: 每帧只做一次 HSV 转换，按查找表得到 0 = 无颜色、1..4 = 对应颜色的标签
+        self.color_labels = {color: index + 1 for index, color in enumerate(self.hsv_color_ranges)}
+        self.label_luts = build_hsv_label_luts(self.hsv_color_ranges)
+        self.templates_manager = TemplatesManager(templates_path, color_ranges=self.hsv_color_ranges)
+        if not self.templates_manager.get_all_templates():
+            raise Exception("错误: 模板加载失败。")
         self.cn_to_en_map = {
             "司令": "commander", "军长": "general", "师长": "major", "旅长": "colonel",
             "团长": "captain", "营长": "battalion", "连长": "lieutenant", "排长": "sergeant",
             "工兵": "miner", "地雷": "landmine", "炸弹": "bomb", "军旗": "flag"
         }
-        self.pool = Pool(processes=cpu_count())
+        # 共享内存须先于进程池创建，工作进程才能共用同一个 resource_tracker
+        self.frame_ring = SharedFrameRing(slots=2)
+        self.pyramid_factor = 2
+        self.atlas = self._build_atlas()
+        # 识别按 (模板库, 图集) 快照进行；切换比例后被替换的图集在没有识别使用时才关闭
+        self._atlas_lock = threading.Lock()
+        self._atlas_users: Dict[str, int] = {}
+        self._retired_atlases: List[TemplateAtlas] = []
+        # 执行后端（见 vision.executors）: "process" / "thread" / "serial" / "auto"
+        self.pool = create_executor(executor, cpu_count(), initializer=_init_worker, initargs=(self.atlas.name,))
+        # 整帧/区域匹配的任务划分代价模型（见 vision.scheduling），按实测耗时在线校准
+        self.cost_model = TaskCostModel()
+        # 每个模板每帧最多保留的峰值数（一方最多 25 枚棋子），None 表示不限制
+        self.max_peaks_per_template = 25
+        # 金字塔模式: 粗匹配阈值（不高于匹配阈值）与全分辨率确认窗口的外扩半径
+        self.pyramid_coarse_threshold = 0.45
+        self.pyramid_refine_radius = 3
+        # 相关匹配后端（见 vision.correlation）: "opencv" 逐模板 matchTemplate；"fft" 同尺寸模板频域批量相关
+        self.correlation_backend = correlation_backend
+        # 检测模式: "full" 全图匹配；"lattice" 锁定分区后只在节点窗口内匹配；"pyramid" 两级金字塔匹配；
+        # "verify" 在 lattice 基础上先用每个节点上一帧的模板复核，复核失败的节点才做完整匹配
+        self.detection_mode = detection_mode
+        self.lattice_slack = lattice_slack
+        self.lattice: List[LatticeNode] = []
+        # 模板缩放（适配 DPI / 窗口尺寸）：比例按 template_scale_step 取整，每个比例的模板库只生成一次
+        self.template_scale_step = 0.05
+        self.camp_match_threshold = 0.8
+        # 缩放校准只做一次（见 calibrate_scale）：以营地模板估计为准；找不到营地时才用锁定分区尺寸的估计，
+        # 且该比例在 scale_fit_nodes 个抽样节点上的匹配得分须高于当前比例（分区是棋子外接框，吃子后会变小）
+        self.scale_fit_nodes = 24
+        self._scale_calibrated = False
+        self._region_scale: Optional[float] = None
+        self._locked_regions: Optional[Dict[str, Tuple[int, int, int, int]]] = None
+        # 锁定分区后按区域只匹配对应方向的模板（见 REGION_ORIENTATIONS）；关闭时所有方向全图匹配
+        self.orientation_routing = True
+        # 相似模板级联剔除（见 TemplatesManager 的相似模板层级），仅对 opencv 后端生效
+        self.template_cascade = True
+        # 节点颜色预分类：节点中心区域内某颜色像素占比低于该值时，不对该节点匹配这种颜色的模板
+        self.color_prefilter = True
+        self.min_color_fraction = 0.2
+        # 空位预筛：同一正方形内灰度标准差或均值低于下限的节点（空路面、行营）直接视为空位。
+        # 样例截图中有棋子节点的标准差 >= 51、均值 >= 126，空位节点分别 <= 40、<= 97
+        self.min_cell_std = 45.0
+        self.min_cell_mean = 110.0
+        self.last_empty_count: Optional[int] = None
+        # 增量识别（节点窗口模式）：只重新匹配窗口内有像素变化的节点，其余沿用上一帧结果；
+        # 灰度差超过 dirty_pixel_tolerance 或颜色标签改变的像素达到 dirty_min_pixels 个即视为变化，
+        # 每 full_rescan_interval 帧做一次完整识别，防止累积漂移
+        self.incremental = True
+        self.dirty_pixel_tolerance = 8
+        self.dirty_min_pixels = 4
+        self.full_rescan_interval = 30
+        # 先验复核（"verify" 模式）的阈值。None 时按模板分别取：与同颜色同方向最相似模板的得分
+        # （见 TemplateBank.similarity）加 verify_margin，且不低于匹配阈值——否则换成相似棋子后旧标签仍能通过复核
+        self.verify_threshold: Optional[float] = None
+        self.verify_margin = 0.05
+        self.last_verified_count: Optional[int] = None
+        self.last_dirty_count: Optional[int] = None
+        # 上一次节点窗口识别各阶段跳过的节点数（见 _detect_lattice），随报告一并输出到日志
+        self.last_lattice_stats: Optional[Dict[str, int]] = None
+        self._incremental_state: Optional[IncrementalState] = None
+        # 连续识别与手动识别可能并发调用 analyze_screenshot，增量状态的读取与替换由该锁保护
+        self._state_lock = threading.Lock()
+        # 节点窗口内容缓存：窗口像素与上次见过的某个窗口完全相同时直接复用其结果；None 表示关闭
+        self.crop_cache: Optional[CropCache] = CropCache()
+
+    def _build_atlas(self) -> TemplateAtlas:
+        """图集前半为当前比例的全分辨率模板，后半为金字塔粗匹配用的缩小模板（ID 偏移 len(bank.entries)）"""
+        bank = self.templates_manager.bank
+        return TemplateAtlas.build(bank.entries + self.templates_manager.coarse_bank(self.pyramid_factor).entries)
+
+    def _round_scale(self, scale: float) -> float:
+        return round(round(scale / self.template_scale_step) * self.template_scale_step, 2)
+
+    def set_template_scale(self, scale: float) -> float:
+        """
+        切换模板缩放比例并重建共享图集（工作进程按新名字自动换绑）与节点网格，返回取整后的比例。
+        旧图集等所有正在使用它的识别结束后才关闭（见 _atlas_in_use）。
+        """
+        scale = self._round_scale(scale)
+        with self._atlas_lock:
+            if scale != self.templates_manager.scale:
+                self.templates_manager.use_scale(scale)
+                self._retired_atlases.append(self.atlas)
+                self.atlas = self._build_atlas()
+                self._close_idle_atlases()
+                if self._locked_regions:
+                    self._build_lattice()
+        return scale
+
+    @contextmanager
+    def _atlas_in_use(self) -> Iterator[Tuple[TemplateBank, TemplateAtlas]]:
+        """一次识别使用的 (模板库, 图集) 快照；识别期间界面线程切换比例不会关闭该图集"""
+        with self._atlas_lock:
+            bank, atlas = self.templates_manager.bank, self.atlas
+            self._atlas_users[atlas.name] = self._atlas_users.get(atlas.name, 0) + 1
+        try:
+            yield bank, atlas
+        finally:
+            with self._atlas_lock:
+                self._atlas_users[atlas.name] -= 1
+                self._close_idle_atlases()
+
+    def _close_idle_atlases(self) -> None:
+        """关闭已被替换、且没有识别在用的图集（调用方持有 _atlas_lock）"""
+        for atlas in [a for a in self._retired_atlases if not self._atlas_users.get(a.name)]:
+            self._retired_atlases.remove(atlas)
+            self._atlas_users.pop(atlas.name, None)
+            atlas.close()
+
+    def calibrate_scale(self, screenshot: np.ndarray, origin: Tuple[int, int] = (0, 0)) -> None:
+        """
+        校准模板缩放比例，成功后不再重复：
+        1. 营地模板多尺度匹配（主要依据）
+        2. 找不到营地时，从锁定分区的尺寸估计出发在节点窗口上搜索吻合最好的比例，且须优于当前比例才切换
+        两者都不可用时保持当前比例，下次调用再试
+        """
+        if self._scale_calibrated:
+            return
+        scale = self.estimate_scale_from_camp(screenshot)
+        if scale is not None:
+            self.set_template_scale(scale)
+            self._scale_calibrated = True
+            return
+        if self._region_scale is None or not self.lattice:
+            return
+        # 分区只会因吃子变小，估计值偏低：从估计值开始逐步增大比例，直到吻合程度不再提高
+        candidate = self._round_scale(self._region_scale)
+        fit = self._scale_fit(screenshot, candidate, origin)
+        while candidate < 2.0:
+            larger = self._round_scale(candidate + self.template_scale_step)
+            larger_fit = self._scale_fit(screenshot, larger, origin)
+            if larger_fit <= fit:
+                break
+            candidate, fit = larger, larger_fit
+        current = self.templates_manager.scale
+        if candidate != current and fit > self._scale_fit(screenshot, current, origin):
+            self.set_template_scale(candidate)
+        self._scale_calibrated = True
+
+    def _scale_fit(self, screenshot: np.ndarray, scale: float, origin: Tuple[int, int] = (0, 0)) -> float:
+        """某一比例的模板库与棋盘的吻合程度：抽样节点窗口内所有模板最佳灰度相关得分的均值"""
+        templates = [cv2.cvtColor(entry.template.image, cv2.COLOR_BGR2GRAY)
+                     for entry in self.templates_manager.scaled_bank(scale).entries]
+        gray = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+        side = max(max(t.shape) for t in templates) + 2 * self.lattice_slack
+        step = max(1, len(self.lattice) // self.scale_fit_nodes)
+        scores = []
+        for node in self.lattice[::step]:
+            x1 = max(int(round(node.center[0] - origin[0] - side / 2)), 0)
+            y1 = max(int(round(node.center[1] - origin[1] - side / 2)), 0)
+            window = gray[y1:y1 + side, x1:x1 + side]
+            best = [cv2.minMaxLoc(cv2.matchTemplate(window, t, cv2.TM_CCOEFF_NORMED))[1] for t in templates
+                    if t.shape[0] <= window.shape[0] and t.shape[1] <= window.shape[1]]
+            best = [score for score in best if np.isfinite(score)]
+            if best:
+                scores.append(max(best))
+        return float(np.mean(scores)) if scores else -1.0
+
+    def estimate_scale_from_camp(self, screenshot: np.ndarray) -> Optional[float]:
+        """多尺度匹配营地模板估计棋盘缩放比例；最佳得分低于 camp_match_threshold 时返回 None"""
+        camp = self.templates_manager.camp_template()
+        if camp is None:
+            return None
+        gray = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+        camp_gray = cv2.cvtColor(camp.image, cv2.COLOR_BGR2GRAY)
+        best_score, best_scale = -1.0, None
+        for scale in np.arange(0.5, 2.0 + 1e-9, self.template_scale_step):
+            w, h = int(round(camp.shape[0] * scale)), int(round(camp.shape[1] * scale))
+            if w > gray.shape[1] or h > gray.shape[0]:
+                break
+            resized = cv2.resize(camp_gray, (w, h), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+            _, score, _, _ = cv2.minMaxLoc(cv2.matchTemplate(gray, resized, cv2.TM_CCOEFF_NORMED))
+            if score > best_score:
+                best_score, best_scale = score, float(scale)
+        return best_scale if best_score >= self.camp_match_threshold else None
+
+    def lock_regions(self, regions: Optional[Dict[str, Tuple[int, int, int, int]]]) -> None:
+        """
+        根据锁定分区（截图坐标）建立棋盘节点网格，供节点窗口模式使用。
+        缩放比例尚未校准时记下由分区尺寸估计的比例，仅作营地模板找不到时的后备（见 calibrate_scale）。
+        """
+        self._locked_regions = regions or None
+        if not regions:
+            self.lattice = []
+            self._region_scale = None
+            return
+        if not self._scale_calibrated:
+            self._region_scale = estimate_board_scale(regions)
+        self._build_lattice()
+
+    def _build_lattice(self) -> None:
+        horizontal = [t.shape for t in self.templates_manager.bank_templates() if t.orientation == "horizontal"]
+        piece_size = max(horizontal) if horizontal else (38, 28)
+        self.lattice = build_lattice(self._locked_regions, piece_size=piece_size)
+
+    def _lattice_windows(self, frame_shape: Tuple[int, ...], origin: Tuple[int, int]) -> np.ndarray:
+        """
+        每个节点的搜索窗口 (x, y, w, h)，帧坐标；窗口为能容纳任意方向模板的正方形加上 slack，超出帧的部分裁掉。
+        中心在帧外的节点（锁定分区或 ROI 与帧不符）窗口为 (0, 0, 0, 0)，不参与匹配
+        """
+        side = max(max(t.shape) for t in self.templates_manager.bank_templates()) + 2 * self.lattice_slack
+        return self._node_squares(frame_shape, origin, side)
 
-    def analyze_screenshot(self, screenshot: np.ndarray, match_threshold: float = 0.7, return_detections: bool = False, nms_threshold: float = 0.3) -> Any:
-        templates_by_color: Dict[str, List] = {}
-        for t in self.templates_manager.get_all_templates():
-            if t.piece_type == "xingying": continue
-            if t.color not in templates_by_color: templates_by_color[t.color] = []
-            templates_by_color[t.color].append(t)
+    def _node_squares(self, frame_shape: Tuple[int, ...], origin: Tuple[int, int], side: int) -> np.ndarray:
+        """
+        以各节点中心为中心、边长 side 的正方形 (x, y, w, h)，帧坐标，裁剪到帧内。
+        只裁剪不平移——平移到帧边会让多个帧外节点落在同一个边缘棋子上；中心在帧外的节点为 (0, 0, 0, 0)
+        """
+        img_h, img_w = frame_shape[:2]
+        centers = np.array([node.center for node in self.lattice], dtype=np.float64) - np.array(origin, dtype=np.float64)
+        inside = (centers[:, 0] >= 0) & (centers[:, 0] < img_w) & (centers[:, 1] >= 0) & (centers[:, 1] < img_h)
+        x1 = np.round(centers[:, 0] - side / 2)
+        y1 = np.round(centers[:, 1] - side / 2)
+        x2, y2 = np.clip(x1 + side, 0, img_w), np.clip(y1 + side, 0, img_h)
+        x1, y1 = np.clip(x1, 0, img_w), np.clip(y1, 0, img_h)
+        squares = np.stack([x1, y1, x2 - x1, y2 - y1], axis=1).astype(np.int32)
+        squares[~inside] = 0
+        return squares
 
-        tasks = [(screenshot, templates, self.hsv_color_ranges, match_threshold, color) for color, templates in templates_by_color.items()]
+    def _prepare_planes(self, screenshot: np.ndarray) -> np.ndarray:
+        """每帧一次：生成 (灰度, 颜色标签) 双平面，工作进程据此直接得到各颜色的掩码灰度图"""
+        img_h, img_w = screenshot.shape[:2]
+        planes = np.empty((2, img_h, img_w), dtype=np.uint8)
+        cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY, dst=planes[0])
+        hsv_label_image(screenshot, self.label_luts, out=planes[1], arena=thread_arena())
+        return planes
 
-        results_from_pool = self.pool.map(_parallel_worker, tasks)
-        all_matches = [item for sublist in results_from_pool for item in sublist]
-        detections = standard_non_max_suppression(all_matches, iou_threshold=nms_threshold)
+    def _classify_cells(self, planes: np.ndarray, origin: Tuple[int, int], colors: Sequence[str]) -> np.ndarray:
+        """
+        用 hsv_color_ranges 对每个节点做廉价的颜色预分类，返回 (节点数, 颜色数) 的布尔候选矩阵。
+        统计节点中心边长为棋子短边的正方形内各颜色像素占比（积分图求和），占比达到
+        min_color_fraction 的颜色才是候选；灰度均值/标准差（同样由积分图 O(1) 求得）低于
+        min_cell_mean / min_cell_std 的节点不可能有棋子，所有颜色都不是候选。
+        """
+        gray, labels = planes[0], planes[1]
+        side = min(min(t.shape) for t in self.templates_manager.bank_templates())
+        cells = self._node_squares(labels.shape, origin, side)
+        x1, y1 = cells[:, 0], cells[:, 1]
+        x2, y2 = x1 + cells[:, 2], y1 + cells[:, 3]
+        area = np.maximum(cells[:, 2] * cells[:, 3], 1)
+
+        candidates = np.zeros((len(self.lattice), len(colors)), dtype=bool)
+        for column, color in enumerate(colors):
+            integral = cv2.integral((labels == self.color_labels[color]).view(np.uint8))
+            counts = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+            candidates[:, column] = counts >= self.min_color_fraction * area
+
+        sums, squares = cv2.integral2(gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        window_sum = sums[y2, x2] - sums[y1, x2] - sums[y2, x1] + sums[y1, x1]
+        window_sq = squares[y2, x2] - squares[y1, x2] - squares[y2, x1] + squares[y1, x1]
+        mean = window_sum / area
+        std = np.sqrt(np.maximum(window_sq / area - mean ** 2, 0))
+        candidates[(std < self.min_cell_std) | (mean < self.min_cell_mean) | (cells[:, 2] == 0)] = False
+        self.last_empty_count = int((~candidates.any(axis=1)).sum())
+        return candidates
+
+    def _dirty_nodes(self, planes: np.ndarray, previous: np.ndarray, windows: np.ndarray) -> np.ndarray:
+        """与上一帧相比窗口内有变化的节点（布尔数组），变化像素数由积分图按窗口求和"""
+        changed = cv2.compare(cv2.absdiff(planes[0], previous[0]), self.dirty_pixel_tolerance, cv2.CMP_GT)
+        cv2.bitwise_or(changed, cv2.compare(planes[1], previous[1], cv2.CMP_NE), dst=changed)
+        integral = cv2.integral(changed)
+        x1, y1 = windows[:, 0], windows[:, 1]
+        x2, y2 = x1 + windows[:, 2], y1 + windows[:, 3]
+        counts = (integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]) // 255
+        return counts >= self.dirty_min_pixels
+
+    def _region_groups(self) -> Dict[str, np.ndarray]:
+        """按区域分组的节点下标；未开启方向路由时所有节点为一组（不限方向）"""
+        if not self.orientation_routing:
+            return {None: np.arange(len(self.lattice))}
+        groups: Dict[str, List[int]] = {}
+        for index, node in enumerate(self.lattice):
+            groups.setdefault(node.region, []).append(index)
+        return {region: np.array(indices) for region, indices in groups.items()}
+
+    def _region_rois(self, frame_shape: Tuple[int, ...], origin: Tuple[int, int]) -> List[Tuple[Optional[str], Optional[Tuple[int, int, int, int]]]]:
+        """
+        方向路由的匹配区域：每个区域取其节点外接框，外扩半个最大模板尺寸加 slack，
+        换算为帧坐标并裁剪到帧内。未锁定分区或关闭路由时返回 [(None, None)]，即全图全方向。
+        """
+        if not (self.orientation_routing and self.lattice):
+            return [(None, None)]
+        img_h, img_w = frame_shape[:2]
+        margin = max(max(t.shape) for t in self.templates_manager.bank_templates()) / 2 + self.lattice_slack
+        rois = []
+        for region, indices in self._region_groups().items():
+            centers = np.array([self.lattice[i].center for i in indices]) - np.array(origin, dtype=np.float64)
+            x1, y1 = np.clip(np.floor(centers.min(axis=0) - margin), 0, [img_w, img_h]).astype(int)
+            x2, y2 = np.clip(np.ceil(centers.max(axis=0) + margin), 0, [img_w, img_h]).astype(int)
+            if x2 > x1 and y2 > y1:
+                rois.append((region, (int(x1), int(y1), int(x2 - x1), int(y2 - y1))))
+        return rois
+
+    def _detect_lattice(self, screenshot: np.ndarray, match_threshold: float, origin: Tuple[int, int],
+                        verify: bool = False) -> DetectionBatch:
+        with self._atlas_in_use() as (bank, atlas):
+            windows = self._lattice_windows(screenshot.shape, origin)
+            colors = bank.colors()
+            planes = self._prepare_planes(screenshot)
+            if self.color_prefilter:
+                candidates = self._classify_cells(planes, origin, colors)
+            else:
+                candidates = np.ones((len(self.lattice), len(colors)), dtype=bool)
+            # 窗口为空（中心在帧外）或被帧边裁得放不下任何模板的节点不参与匹配
+            template_sizes = atlas.table[:len(bank.entries), [2, 1]]
+            candidates[(windows[:, 2] < template_sizes[:, 0].min()) | (windows[:, 3] < template_sizes[:, 1].min())] = False
+            occupied = int(candidates.any(axis=1).sum())
+
+            # 上一帧状态：帧尺寸与参数未变且未到完整识别周期时有效。增量识别只匹配有变化的节点，先验复核以其记录为先验
+            key = (planes.shape, atlas.name, windows.tobytes(), match_threshold, self.orientation_routing,
+                   self.color_prefilter, self.min_color_fraction, self.min_cell_std, self.min_cell_mean)
+            with self._state_lock:
+                state = self._incremental_state
+            fresh = state is not None and state.key == key and state.frames_since_full + 1 < self.full_rescan_interval
+            reuse = fresh and self.incremental
+            dirty = self._dirty_nodes(planes, state.planes, windows) if reuse else np.ones(len(self.lattice), dtype=bool)
+            candidates &= dirty[:, None]
+            self.last_dirty_count = int(dirty.sum())
+            changed = int(candidates.any(axis=1).sum())
+
+            # 内容缓存：窗口像素、所属区域与候选颜色都相同的节点直接复用缓存结果（坐标相对窗口保存）
+            cached, crop_keys = [], {}
+            crop_context = key[:2] + key[3:]
+            if self.crop_cache is not None:
+                self.crop_cache.bind(crop_context)
+                for node in np.flatnonzero(candidates.any(axis=1)):
+                    wx, wy, ww, wh = windows[node]
+                    region = self.lattice[node].region if self.orientation_routing else None
+                    crop_key = self.crop_cache.key(planes[:, wy:wy + wh, wx:wx + ww], (region, candidates[node].tobytes()))
+                    value = self.crop_cache.get(crop_key, context=crop_context)
+                    if not self.crop_cache.found(value):
+                        crop_keys[node] = crop_key
+                        continue
+                    candidates[node] = False
+                    if value is not None:
+                        template_id, dx, dy, score = value
+                        cached.append((node, template_id, wx + dx, wy + dy, score))
+
+            # 先验复核：仍待匹配、上一帧有棋子且该颜色仍是候选的节点，先只用上一帧的模板匹配一次
+            frame_handle, verified = None, np.empty(0, dtype=NODE_MATCH_DTYPE)
+            if verify and fresh:
+                color_columns = {color: column for column, color in enumerate(colors)}
+                template_columns = np.array([color_columns.get(entry.color, -1) for entry in bank.entries])
+                priors = state.records[state.records['template_id'] < len(bank.entries)]
+                priors = priors[candidates[priors['node'], template_columns[priors['template_id']]]]
+                if len(priors):
+                    frame_handle = self.frame_ring.publish(planes)
+                    labels = [self.color_labels[colors[column]] for column in template_columns[priors['template_id']]]
+                    if self.verify_threshold is not None:
+                        thresholds = np.full(len(priors), max(match_threshold, self.verify_threshold))
+                    elif bank.similarity is not None:
+                        thresholds = np.maximum(match_threshold, bank.similarity[priors['template_id']] + self.verify_margin)
+                    else:
+                        thresholds = np.full(len(priors), match_threshold)
+                    chunks = np.array_split(np.arange(len(priors)), min(len(priors), cpu_count()))
+                    verified = np.concatenate(self.pool.map(_verify_worker, [
+                        (frame_handle, atlas.name, [labels[i] for i in chunk], thresholds[chunk], priors[chunk], windows[priors['node'][chunk]])
+                        for chunk in chunks], work=int(windows[priors['node'], 2:].prod(axis=1).sum())))
+                    candidates[verified['node']] = False
+            self.last_verified_count = len(verified)
+            matched = int(candidates.any(axis=1).sum())
+            self.last_lattice_stats = {
+                "nodes": len(self.lattice), "empty": len(self.lattice) - occupied, "unchanged": occupied - changed,
+                "cached": changed - matched - len(verified), "verified": len(verified), "matched": matched}
+
+            if candidates.any() and frame_handle is None:
+                frame_handle = self.frame_ring.publish(planes)
+            tasks = []
+            for column, color in enumerate(colors):
+                for region, nodes in self._region_groups().items():
+                    # 只把预分类为该颜色的节点交给该颜色的模板，空位节点完全跳过
+                    nodes = nodes[candidates[nodes, column]]
+                    if len(nodes):
+                        tasks.append((frame_handle, atlas.name, bank.ids_for_color(color, orientations=REGION_ORIENTATIONS.get(region)),
+                                      self.color_labels[color], match_threshold, nodes, windows[nodes]))
+            work = sum(len(task[2]) * int(task[6][:, 2:].prod(axis=1).sum()) for task in tasks)
+            # 每个节点只保留各颜色中得分最高的标签，无需全局 NMS；任务完成一个合并一个
+            records = np.empty(0, dtype=NODE_MATCH_DTYPE)
+            for result in self.pool.imap_unordered(_lattice_worker, tasks, work=work):
+                records = _best_per_node(np.concatenate([records, result]))
+            records = np.concatenate([records, verified])
+            if crop_keys:
+                found = {int(r['node']): r for r in records}
+                for node, crop_key in crop_keys.items():
+                    record = found.get(node)
+                    wx, wy = windows[node, :2]
+                    self.crop_cache.put(crop_key, None if record is None else
+                                        (int(record['template_id']), int(record['x'] - wx), int(record['y'] - wy), float(record['score'])),
+                                        context=crop_context)
+            records = np.concatenate([records, np.array(cached, dtype=NODE_MATCH_DTYPE)])
+            # 未变化的节点沿用上一帧的记录
+            if reuse:
+                records = np.concatenate([state.records[~dirty[state.records['node']]], records])
+            if self.incremental or verify:
+                with self._state_lock:
+                    self._incremental_state = IncrementalState(key, planes, records, state.frames_since_full + 1 if fresh else 0)
+            return DetectionBatch.from_matches(records, [entry.template for entry in bank.entries]).sort_by_score()
+
+    def _plan_tasks(self, bank, rois, frame_shape: Tuple[int, ...], match_threshold: float, tile: bool) -> List[Tuple]:
+        """
+        把一帧的匹配拆成 (颜色, 模板块, 区域条带) 任务，返回 [(颜色, 模板 ID, roi, 负责行, 级联簇, 代价单位)]，按代价降序。
+        代价单位 = 搜索像素 x 模板像素；按 cost_model 估计总耗时后，每个任务的目标代价约为
+        总代价 / (核数 x 8)。模板按顺序打包成块（启用级联时以相似模板簇为单元，簇不拆开），
+        单块仍超出目标代价时再把区域按行切成条带（tile=False 时不切）。条带的 roi 带有峰值判定用的上下文行，
+        负责行为本条保留的匹配左上角 y 范围（见 scheduling.pad_strips）；不切时为 None。
+        """
+        img_h, img_w = frame_shape[:2]
+        cascade = self.template_cascade and self.correlation_backend == "opencv" and bool(bank.clusters)
+        groups = []
+        for color in bank.colors():
+            for region, roi in rois:
+                ids = bank.ids_for_color(color, orientations=REGION_ORIENTATIONS.get(region))
+                if cascade:
+                    units = [(c.members, c) for c in bank.clusters_for(ids)]
+                else:
+                    units = [([template_id], None) for template_id in ids]
+                area = roi[2] * roi[3] if roi is not None else img_w * img_h
+                costs = [area * sum(bank.entries[i].gray.size for i in members) for members, _ in units]
+                groups.append((color, roi, units, costs))
+
+        total = self.cost_model.estimate(sum(sum(costs) for *_, costs in groups))
+        target = target_task_cost(total, self.pool.workers)
+        plan = []
+        for color, roi, units, costs in groups:
+            for chunk in chunk_units([self.cost_model.estimate(c) for c in costs], target):
+                ids = [i for k in chunk for i in units[k][0]]
+                clusters = ([(units[k][1].representative, units[k][1].members, units[k][1].representative_threshold(match_threshold))
+                             for k in chunk] if cascade else None)
+                cost = sum(costs[k] for k in chunk)
+                parts = math.ceil(self.cost_model.estimate(cost) / target) if tile and math.isfinite(target) else 1
+                strips = [(roi, None)]
+                if parts > 1:
+                    template_h = max(bank.entries[i].gray.shape[0] for i in ids)
+                    region = roi if roi is not None else (0, 0, img_w, img_h)
+                    split = split_rows(region, template_h, parts)
+                    if len(split) > 1:
+                        strips = pad_strips(region, split, _PEAK_CONTEXT)
+                plan.extend((color, ids, strip, rows, clusters, cost / len(strips)) for strip, rows in strips)
+        return balance_tasks(plan, [task[5] for task in plan])
+
+    def _detect(self, screenshot: np.ndarray, match_threshold: float, nms_threshold: float,
+                origin: Tuple[int, int] = (0, 0), routed: bool = True, pyramid: bool = False) -> DetectionBatch:
+        with self._atlas_in_use() as (bank, atlas):
+            frame_handle = self.frame_ring.publish(self._prepare_planes(screenshot))
+            rois = self._region_rois(screenshot.shape, origin) if routed else [(None, None)]
+            # 金字塔的确认窗口不能跨条带，只按模板分块
+            plan = self._plan_tasks(bank, rois, screenshot.shape, match_threshold, tile=not pyramid)
+            tasks = [(frame_handle, atlas.name, ids, self.color_labels[color], match_threshold, self.max_peaks_per_template, roi)
+                     for color, ids, roi, *_ in plan]
+            img_h, img_w = screenshot.shape[:2]
+            work = sum(len(ids) * (roi[2] * roi[3] if roi is not None else img_w * img_h) for _, ids, roi, *_ in plan)
+            start = time.perf_counter()
+            if pyramid:
+                pyramid_args = (len(bank.entries), self.pyramid_factor,
+                                min(match_threshold, self.pyramid_coarse_threshold), self.pyramid_refine_radius)
+                results = self.pool.imap_unordered(_pyramid_worker, [task + pyramid_args for task in tasks],
+                                                   work=work // (self.pyramid_factor ** 2))
+            else:
+                results = self.pool.imap_unordered(_parallel_worker, [task + (rows, self.correlation_backend, clusters)
+                                                                      for task, (_, _, _, rows, clusters, _) in zip(tasks, plan)], work=work)
+
+            # 父进程按完成顺序收集各任务的峰值，全部返回后对其并集只做一次 NMS。贪心 NMS 不满足结合律，
+            # 逐个并入滚动 NMS 或在任务内先做 NMS，保留集都会随完成顺序或任务划分变化。
+            # 行条带的峰值在这里按模板统一截取 max_peaks_per_template 个（不切条带的任务已在工作进程内截取）
+            matches = _merge_matches([result for result in results if len(result)])
+            if not pyramid:
+                matches = _top_peaks(matches, self.max_peaks_per_template)
+            survivors = nms_matches(matches, atlas.table[:, [2, 1]], nms_threshold)
+            if not pyramid:
+                self.cost_model.observe(sum(task[5] for task in plan), time.perf_counter() - start,
+                                        min(self.pool.workers, len(tasks)))
+            return DetectionBatch.from_matches(survivors, [entry.template for entry in bank.entries])
+
+    def analyze_screenshot(self, screenshot: np.ndarray, match_threshold: float = 0.7, return_detections: bool = False, nms_threshold: float = 0.3,
+                           origin: Tuple[int, int] = (0, 0), detection_mode: Optional[str] = None) -> Any:
+        """
+        origin: 传入图像左上角在完整截图中的坐标（按棋盘 ROI 裁剪时传入 ROI 左上角）
+        detection_mode: 覆盖 self.detection_mode（"full" / "lattice" / "pyramid" / "verify"）；未锁定分区时 "lattice"、"verify" 自动退回全图匹配
+        """
+        mode = detection_mode or self.detection_mode
+        if self.lattice and not self._scale_calibrated:
+            self.calibrate_scale(screenshot, origin)
+        if mode in ("lattice", "verify") and self.lattice:
+            detections = self._detect_lattice(screenshot, match_threshold, origin, verify=(mode == "verify"))
+        else:
+            detections = self._detect(screenshot, match_threshold, nms_threshold, origin, pyramid=(mode == "pyramid"))
 
         if return_detections:
             return detections
 
         total_detection_count = len(detections)
+        # 节点窗口模式在报告末尾附一行跳过统计，随报告进入连续/手动识别的日志
+        stats_items = [self._lattice_stats_item()] if mode in ("lattice", "verify") and self.lattice else []
 
         if not detections:
             return {
                 'total_count': 0,
-                'report_items': [{'type': 'header', 'text': "未在截图中识别到任何棋子。"}]
+                'report_items': [{'type': 'header', 'text': "未在截图中识别到任何棋子。"}] + stats_items
             }
 
         img_h, img_w, _ = screenshot.shape
-        pieces_by_color: Dict[str, List[DetectionResult]] = {}
-        for det in detections:
-            color = det.template.color
-            if color not in pieces_by_color: pieces_by_color[color] = []
-            pieces_by_color[color].append(det)
+        pieces_by_color = detections.group_by_color()
 
         player_locations: Dict[str, str] = {}
         for color, dets in pieces_by_color.items():
-            if not dets: continue
-            avg_x = np.mean([d.location[0] for d in dets]); avg_y = np.mean([d.location[1] for d in dets])
+            if not len(dets): continue
+            avg_x, avg_y = dets.locations.mean(axis=0)
             if avg_y < img_h * 0.45: location = "上方"
             elif avg_y > img_h * 0.55: location = "下方"
             elif avg_x < img_w / 2: location = "左侧"
@@ -171,7 +966,7 @@ class GameAnalyzer:
                 'color': color
             })
 
-            counts = Counter(d.template.piece_type for d in dets)
+            counts = Counter(dets.piece_types.tolist())
 
             player_report_data = []
             for piece_cn, piece_en in self.cn_to_en_map.items():
@@ -188,40 +983,42 @@ class GameAnalyzer:
 
         return {
             'total_count': total_detection_count,
-            'report_items': report_items
+            'report_items': report_items + stats_items
         }
 
-    def get_all_detections(self, board_image: np.ndarray, match_threshold: float = 0.8) -> List[DetectionResult]:
+    def _lattice_stats_item(self) -> Dict[str, str]:
+        """上一次节点窗口识别的报告行：各阶段跳过的节点数与内容缓存命中率"""
+        stats = self.last_lattice_stats
+        text = (f"[节点识别] 共 {stats['nodes']} 个节点，完整匹配 {stats['matched']} 个；跳过: 空位 {stats['empty']}，"
+                f"未变化 {stats['unchanged']}，内容缓存 {stats['cached']}，先验复核 {stats['verified']}")
+        if self.crop_cache is not None:
+            cache = self.crop_cache.stats()
+            text += f"；内容缓存累计命中率 {cache['hit_rate']:.0%}（{cache['entries']} 条，{cache['bytes'] / 1024:.0f} KB）"
+        return {'type': 'info', 'text': text}
+
+    def get_all_detections(self, board_image: np.ndarray, match_threshold: float = 0.8, origin: Tuple[int, int] = (0, 0)) -> DetectionBatch:
         """兼容性方法 - 调用analyze_screenshot获取检测结果"""
-        return self.analyze_screenshot(board_image, match_threshold, return_detections=True)
+        return self.analyze_screenshot(board_image, match_threshold, return_detections=True, origin=origin)
 
     def get_player_regions(self, screenshot: np.ndarray, match_threshold: float = 0.7, nms_threshold: float = 0.3) -> Dict[str, Tuple[int, int, int, int]]:
         img_h, img_w, _ = screenshot.shape
-        templates_by_color: Dict[str, List] = {}
-        for t in self.templates_manager.get_all_templates():
-            if t.piece_type == "xingying": continue
-            if t.color not in templates_by_color: templates_by_color[t.color] = []
-            templates_by_color[t.color].append(t)
-
-        tasks = [(screenshot, templates, self.hsv_color_ranges, match_threshold, color) for color, templates in templates_by_color.items()]
-        results_from_pool = self.pool.map(_parallel_worker, tasks)
-        all_matches = [item for sublist in results_from_pool for item in sublist]
-
-        detections = standard_non_max_suppression(all_matches, iou_threshold=nms_threshold)
+        # 首次发现分区前先用营地模板校准缩放比例，否则非 100% DPI 下模板尺寸对不上
+        self.calibrate_scale(screenshot)
+        # 分区发现阶段不能依赖已锁定的分区，始终全图全方向匹配
+        detections = self._detect(screenshot, match_threshold, nms_threshold, routed=False)
         return self._get_regions_from_clusters(detections, img_w, img_h)
 
-    def _get_regions_from_clusters(self, detections: List[DetectionResult], img_w: int, img_h: int) -> Dict[str, Tuple[int, int, int, int]]:
-        if not detections: return {}
+    def _get_regions_from_clusters(self, detections: DetectionBatch, img_w: int, img_h: int) -> Dict[str, Tuple[int, int, int, int]]:
+        if not len(detections): return {}
         num_clusters = min(4, len(detections))
         if num_clusters < 4: return {"未知": (0,0,img_w,img_h)}
-        centers = [(det.location[0], det.location[1]) for det in detections]
+        centers = detections.locations
         kmeans = KMeans(n_clusters=num_clusters, random_state=0, n_init='auto').fit(centers)
-        clustered_dets = {i: [] for i in range(num_clusters)}
-        for i, det in enumerate(detections): clustered_dets[kmeans.labels_[i]].append(det)
         player_clusters = {}
-        for label, dets in clustered_dets.items():
-            if not dets: continue
-            avg_x = np.mean([d.location[0] for d in dets]); avg_y = np.mean([d.location[1] for d in dets])
+        for label in range(num_clusters):
+            dets = detections.filter(kmeans.labels_ == label)
+            if not len(dets): continue
+            avg_x, avg_y = dets.locations.mean(axis=0)
             if avg_y < img_h * 0.4: region_name = "上方"
             elif avg_y > img_h * 0.6: region_name = "下方"
             elif avg_x < img_w / 2: region_name = "左侧"
@@ -229,9 +1026,8 @@ class GameAnalyzer:
             player_clusters[region_name] = dets
         player_bounds = {}
         for name, dets in player_clusters.items():
-            min_x=min(d.location[0] for d in dets); min_y=min(d.location[1] for d in dets)
-            max_x=max(d.location[0]+d.template.shape[0] for d in dets); max_y=max(d.location[1]+d.template.shape[1] for d in dets)
-            player_bounds[name] = (min_x, min_y, max_x, max_y)
+            min_x, min_y = dets.boxes[:, :2].min(axis=0); max_x, max_y = dets.boxes[:, 2:].max(axis=0)
+            player_bounds[name] = (int(min_x), int(min_y), int(max_x), int(max_y))
         if all(k in player_bounds for k in ["上方", "下方", "左侧", "右侧"]):
             central_x1=player_bounds["左侧"][2]; central_x2=player_bounds["右侧"][0]
             central_y1=player_bounds["上方"][3]; central_y2=player_bounds["下方"][1]
@@ -252,4 +1048,6 @@ class GameAnalyzer:
 
     def __del__(self):
         self.pool.close()
-        self.pool.join()
\ No newline at end of file
+        self.frame_ring.close()
+        for atlas in self._retired_atlases + [self.atlas]:
+            atlas.close()
\ No newline at end of file
@@ -171,6 +171,86 @@ class GameLogicEngine:
                         break
         return events
 
+# --- Board Lattice ---
+# 各区域的节点行列数：上下方竖排 6 行 5 列，左右两侧横排 5 行 6 列，中央 3x3
+REGION_LATTICE = {
+    "上方": (6, 5), "下方": (6, 5),
+    "左侧": (5, 6), "右侧": (5, 6),
+    "中央": (3, 3)
+}
+
+# 各区域可能出现的模板方向：上下方为横向，两侧各用自己的方向，中央可能出现任意一方的棋子
+REGION_ORIENTATIONS = {
+    "上方": ("horizontal",), "下方": ("horizontal",),
+    "左侧": ("left",), "右侧": ("right",),
+    "中央": ("horizontal", "left", "right")
+}
+
+@dataclass
+class LatticeNode:
+    """A single board node (a cell a piece can stand on)."""
+    region: str
+    cell: Tuple[int, int]
+    center: Tuple[float, float]
+
+def _axis_centers(lo: float, hi: float, count: int, piece_extent: float) -> List[float]:
+    # 锁定区域是棋子框的外接矩形，首末节点中心各距边界半个棋子
+    if count == 1:
+        return [(lo + hi) / 2]
+    first, last = lo + piece_extent / 2, hi - piece_extent / 2
+    step = (last - first) / (count - 1)
+    return [first + i * step for i in range(count)]
+
+def build_lattice(locked_regions: Dict, piece_size: Tuple[int, int] = (38, 28)) -> List[LatticeNode]:
+    """
+    Build the board lattice from locked regions.
+    piece_size is the (w, h) of a horizontal piece; side regions use it rotated.
+    Centre nodes reuse the columns of 上方 and the rows of 左侧 (every other node),
+    falling back to an even 3x3 split of the centre bounds.
+    """
+    nodes: List[LatticeNode] = []
+    axis: Dict[str, Tuple[List[float], List[float]]] = {}
+    for region_name, bounds in locked_regions.items():
+        if region_name == "中央" or region_name not in REGION_LATTICE:
+            continue
+        x1, y1, x2, y2 = bounds
+        rows, cols = REGION_LATTICE[region_name]
+        pw, ph = piece_size if rows > cols else piece_size[::-1]
+        xs = _axis_centers(x1, x2, cols, pw)
+        ys = _axis_centers(y1, y2, rows, ph)
+        axis[region_name] = (xs, ys)
+        nodes.extend(LatticeNode(region_name, (r, c), (xs[c], ys[r])) for r in range(rows) for c in range(cols))
+
+    if "中央" in locked_regions:
+        x1, y1, x2, y2 = locked_regions["中央"]
+        xs = axis["上方"][0][::2] if "上方" in axis else [x1 + (x2 - x1) * (i + 0.5) / 3 for i in range(3)]
+        ys = axis["左侧"][1][::2] if "左侧" in axis else [y1 + (y2 - y1) * (i + 0.5) / 3 for i in range(3)]
+        nodes.extend(LatticeNode("中央", (r, c), (xs[c], ys[r])) for r in range(3) for c in range(3))
+    return nodes
+
+# 模板原始尺寸（100% 缩放）下各玩家锁定区域的 (宽, 高)，用于估计当前窗口的棋盘缩放比例
+REFERENCE_REGION_SIZE = {
+    "上方": (195, 223), "下方": (195, 223),
+    "左侧": (223, 194), "右侧": (223, 194)
+}
+
+def estimate_board_scale(locked_regions: Dict) -> Optional[float]:
+    """
+    Estimate the board scale relative to the templates from locked region sizes.
+    Takes the median of the width and height ratios of the four player regions.
+    """
+    ratios = []
+    for region_name, (ref_w, ref_h) in REFERENCE_REGION_SIZE.items():
+        if region_name not in locked_regions:
+            continue
+        x1, y1, x2, y2 = locked_regions[region_name]
+        ratios.extend([(x2 - x1) / ref_w, (y2 - y1) / ref_h])
+    if not ratios:
+        return None
+    ratios.sort()
+    mid = len(ratios) // 2
+    return ratios[mid] if len(ratios) % 2 else (ratios[mid - 1] + ratios[mid]) / 2
+
 # --- Utility Function ---
 def map_pixel_to_grid(px: int, py: int, locked_regions: Dict) -> Optional[Tuple[str, Tuple[int, int]]]:
     for region_name, bounds in locked_regions.items():
@@ -179,13 +259,8 @@ def map_pixel_to_grid(px: int, py: int, locked_regions: Dict) -> Optional[Tuple[
             continue
         region_w = x2 - x1
         region_h = y2 - y1
-        if region_name == "中央":
-            rows, cols = 3, 3
-            cell_w, cell_h = region_w / cols, region_h / rows
-            col = int((px - x1) / cell_w)
-            row = int((py - y1) / cell_h)
-            return region_name, (row, col)
-        rows, cols = 6, 5
+        # 网格坐标沿用原约定：中央 3x3，其余区域一律 6 行 5 列（与 REGION_LATTICE 的节点编号无关）
+        rows, cols = (3, 3) if region_name == "中央" else (6, 5)
         cell_w, cell_h = region_w / cols, region_h / rows
         col = int((px - x1) / cell_w)
         row = int((py - y1) / cell_h)
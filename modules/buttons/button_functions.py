@@ -14,6 +14,7 @@ import numpy as np
 from pathlib import Path
 from threading import Thread
 from typing import Optional, List, Dict, Any
+from collections import Counter
 
 # 导入核心模块
 from capture.realtime_capture import WindowCapture
@@ -104,11 +105,13 @@ class ButtonFunctions:
         if self.app_state.board_roi:
             x1, y1, x2, y2 = self.app_state.board_roi
             board_image = screenshot[y1:y2, x1:x2]
+            origin = (x1, y1)
         else:
             board_image = screenshot
+            origin = (0, 0)
 
         try:
-            report = self.app_state.game_analyzer.analyze_screenshot(board_image, match_threshold=match_threshold, nms_threshold=nms_threshold)
+            report = self.app_state.game_analyzer.analyze_screenshot(board_image, match_threshold=match_threshold, nms_threshold=nms_threshold, origin=origin)
             self.log_manager.log_to_dashboard(report, recognition_id=recognition_id)
         except Exception as e:
             self.log_manager.log_message(f"[严重错误] 分析时出错: {e}", "p_red")
@@ -154,7 +157,7 @@ class ButtonFunctions:
 
                 # 使用与按钮2相同的识别方法和时间戳格式
                 recognition_id = time.strftime("%Y%m%d%H%M-%S")
-                report = self.app_state.game_analyzer.analyze_screenshot(board_image, match_threshold, nms_threshold=nms_threshold)
+                report = self.app_state.game_analyzer.analyze_screenshot(board_image, match_threshold, nms_threshold=nms_threshold, origin=(x1, y1))
 
                 # 使用相同的日志输出格式
                 self.ui_manager.root.after(0, self.log_manager.log_to_dashboard, report, recognition_id)
@@ -184,6 +187,8 @@ class ButtonFunctions:
         max_x = max(r[2] for r in regions)
         max_y = max(r[3] for r in regions)
         self.app_state.board_roi = (int(min_x), int(min_y), int(max_x), int(max_y))
+        if self.app_state.game_analyzer:
+            self.app_state.game_analyzer.lock_regions(self.app_state.locked_regions)
         self.log_manager.log_message(f"[信息] 棋盘ROI计算完成: {self.app_state.board_roi}")
 
     def visualize_regions(self):
@@ -312,22 +317,20 @@ class ButtonFunctions:
             # 使用get_all_detections方法
             # 获取当前阈值
             match_threshold, nms_threshold = self.threshold_manager.get_thresholds()
-            all_results = self.app_state.game_analyzer.get_all_detections(board_image, match_threshold)
+            all_results = self.app_state.game_analyzer.get_all_detections(board_image, match_threshold, origin=(x1, y1))
 
             vis_image = screenshot.copy()
             cv2.rectangle(vis_image, (x1, y1), (x2, y2), (0, 0, 255), 2)
 
-            node_count = 0
-            for result in all_results:
-                node_count += 1
-                bbox = result.bbox
+            node_count = len(all_results)
+            for bbox, piece_name in zip(all_results.boxes.tolist(), all_results.piece_types.tolist()):
                 abs_x = bbox[0] + x1
                 abs_y = bbox[1] + y1
                 w = bbox[2] - bbox[0]
                 h = bbox[3] - bbox[1]
 
                 cv2.rectangle(vis_image, (abs_x, abs_y), (abs_x + w, abs_y + h), (0, 255, 0), 2)
-                label = f"{result.piece_name}"
+                label = f"{piece_name}"
                 cv2.putText(vis_image, label, (abs_x, abs_y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
 
             self.log_manager.log_message(f"共检测到 {node_count} 个棋子节点。")
@@ -479,17 +482,15 @@ class ButtonFunctions:
                 "orange": (0, 165, 255), "purple": (255, 0, 255)
             }
 
-            detection_count = 0
-            for detection in all_detections:
-                detection_count += 1
-                bbox = detection.bbox
-                color = color_map.get(detection.color, (255, 255, 255))
+            detection_count = len(all_detections)
+            for bbox, piece_name, det_color in zip(all_detections.boxes.tolist(), all_detections.piece_types.tolist(), all_detections.colors.tolist()):
+                color = color_map.get(det_color, (255, 255, 255))
 
                 # 绘制检测框
                 cv2.rectangle(vis_image, (bbox[0], bbox[1]), (bbox[2], bbox[3]), color, 2)
 
                 # 添加标签
-                label = f"{detection.piece_name}({detection.color})"
+                label = f"{piece_name}({det_color})"
                 cv2.putText(vis_image, label, (bbox[0], bbox[1] - 5),
                            cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
 
@@ -502,24 +503,14 @@ class ButtonFunctions:
             self.log_manager.log_message(f"[结果] 全图识别完成！检测到 {detection_count} 个棋子。", "h_default")
 
             # 按颜色统计
-            color_counts = {}
-            for detection in all_detections:
-                color = detection.color
-                if color not in color_counts:
-                    color_counts[color] = 0
-                color_counts[color] += 1
+            color_counts = Counter(all_detections.colors.tolist())
 
             for color, count in color_counts.items():
                 self.log_manager.log_message(f"  - {color}: {count} 个", color_map.get(color, "p_default"))
 
             # 按棋子类型统计
             from modules.core.config import COLOR_TAG_MAP
-            piece_counts = {}
-            for detection in all_detections:
-                piece_type = detection.piece_name
-                if piece_type not in piece_counts:
-                    piece_counts[piece_type] = 0
-                piece_counts[piece_type] += 1
+            piece_counts = Counter(all_detections.piece_types.tolist())
 
             for piece_type, count in piece_counts.items():
                 tag = COLOR_TAG_MAP.get(piece_type, "p_default")
@@ -99,7 +99,8 @@ class ModularDashboardApp:
     def initialize_analyzer(self):
         """初始化分析器"""
         try:
-            self.app_state.game_analyzer = GameAnalyzer(config.templates_dir)
+            self.app_state.game_analyzer = GameAnalyzer(config.templates_dir, detection_mode=config.detection_mode, lattice_slack=config.lattice_slack,
+                                                       correlation_backend=config.correlation_backend, executor=config.executor)
             self.log_manager.log_message("--- 战情室启动成功 ---")
 
             regions_file = config.regions_file
@@ -107,6 +108,7 @@ class ModularDashboardApp:
                 try:
                     with open(regions_file, 'r') as f:
                         self.app_state.locked_regions = json.load(f)
+                    self.app_state.game_analyzer.lock_regions(self.app_state.locked_regions)
                     self.log_manager.log_message("[信息] 已成功从文件加载锁定的分区数据。")
                 except Exception as e:
                     self.log_manager.log_message(f"[错误] 加载分区文件失败: {e}", "p_red")
@@ -35,6 +35,16 @@ class SystemConfig:
         self.default_match_threshold = 0.8
         self.default_nms_threshold = 0.3
 
+        # 检测模式: "full" 全图匹配；"lattice" 锁定分区后只在棋盘节点窗口内匹配；"pyramid" 两级金字塔匹配；
+        # "verify" 在 lattice 基础上先用上一帧的标签复核每个节点。
+        # lattice/verify 会同时启用跨帧增量匹配与格子结果缓存，需显式选择
+        self.detection_mode = "full"
+        self.lattice_slack = 6
+        # 相关匹配后端: "opencv" 或 "fft"（整帧匹配时 fft 更快，见 benchmarks/bench_correlation.py）
+        self.correlation_backend = "opencv"
+        # 执行后端: "process" / "thread" / "serial" / "auto"（见 benchmarks/bench_executors.py）
+        self.executor = "process"
+
         # 框架高度配置
         self.threshold_frame_height = 40
         self.info_frame_height = 650
@@ -0,0 +1,63 @@
+"""
+可复用缓冲区
+匹配循环与预处理中的 OpenCV 调用通过 dst/result 参数写入按 (用途, 形状, 类型) 缓存的缓冲区，
+连续识别时每帧不再重新分配几 MB 的得分图与掩码图，减少分配器抖动与常驻内存峰值。
+- 缓冲区归属于线程（thread_arena），进程池、线程池与串行执行后端都可安全使用
+- 同一用途的缓冲区在下一次 get() 时会被覆盖，调用方需要保留结果时应自行复制
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+class BufferArena:
+    """
+    按 (用途, 形状, 类型) 缓存缓冲区；总字节数超过 max_bytes 时淘汰最久未用的
+    - allocations: 新分配的缓冲区个数
+    - reuses: 复用已有缓冲区的次数
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._buffers: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self.nbytes = 0
+        self.allocations = 0
+        self.reuses = 0
+
+    def get(self, name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """返回内容未定义的缓冲区"""
+        key = (name, tuple(shape), np.dtype(dtype).str)
+        buffer = self._buffers.get(key)
+        if buffer is not None:
+            self._buffers.move_to_end(key)
+            self.reuses += 1
+            return buffer
+        buffer = np.empty(shape, dtype=dtype)
+        self._buffers[key] = buffer
+        self.nbytes += buffer.nbytes
+        self.allocations += 1
+        while self.nbytes > self.max_bytes and len(self._buffers) > 1:
+            _, evicted = self._buffers.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        return buffer
+
+    def clear(self) -> None:
+        self._buffers.clear()
+        self.nbytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"buffers": len(self._buffers), "bytes": self.nbytes,
+                "allocations": self.allocations, "reuses": self.reuses}
+
+
+_local = threading.local()
+
+
+def thread_arena() -> BufferArena:
+    """当前线程的缓冲区（工作进程中即该进程的缓冲区）"""
+    arena = getattr(_local, "arena", None)
+    if arena is None:
+        arena = _local.arena = BufferArena()
+    return arena
@@ -0,0 +1,130 @@
+"""
+相关匹配后端
+- "opencv": 逐模板调用 cv2.matchTemplate(TM_CCOEFF_NORMED)
+- "fft": 按模板尺寸分组，帧只做一次 FFT，在频域与预先变换好的同尺寸模板栈批量相乘，
+  一次得到整组模板的得分图；归一化所需的窗口均值/方差由积分图给出。
+两种后端输出相同定义的 TM_CCOEFF_NORMED 得分图（数值误差约 1e-5）。
+"""
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+import scipy.fft
+
+CORRELATION_BACKENDS = ("opencv", "fft")
+
+
+def _normalize_scores(numerator: np.ndarray, inv_window_std: np.ndarray, template_norm: float) -> np.ndarray:
+    """
+    与 OpenCV 相同的归一化与退化处理（原地修改 numerator）：
+    |r| < 1 取 r；1 <= |r| < 1.125 视为舍入误差取 ±1；更大的值置 0。
+    方差为 0 的窗口 inv_window_std 为 0，得分即为 0，与 OpenCV 一致。
+    """
+    np.multiply(numerator, inv_window_std, out=numerator)
+    numerator *= np.float32(1.0 / template_norm)
+    overflow = np.abs(numerator) >= 1
+    if overflow.any():
+        values = numerator[overflow]
+        numerator[overflow] = np.where(np.abs(values) < 1.125, np.sign(values), 0)
+    return numerator
+
+
+class _SizeGroup:
+    """同尺寸模板栈：去均值后的模板与其 L2 范数，频谱按 FFT 尺寸缓存"""
+
+    def __init__(self, indices: List[int], templates: List[np.ndarray]):
+        self.indices = indices
+        self.shape = templates[0].shape[:2]
+        stack = np.stack([t.astype(np.float32) for t in templates])
+        stack -= stack.mean(axis=(1, 2), keepdims=True)
+        self.zero_mean = stack
+        self.norms = np.sqrt((stack.astype(np.float64) ** 2).sum(axis=(1, 2)))
+        self.spectra: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def spectrum(self, fft_shape: Tuple[int, int]) -> np.ndarray:
+        """模板栈的共轭频谱（相关 = 与共轭相乘），按 FFT 尺寸缓存"""
+        spectrum = self.spectra.get(fft_shape)
+        if spectrum is None:
+            spectrum = np.conj(scipy.fft.rfft2(self.zero_mean, s=fft_shape, axes=(1, 2)))
+            self.spectra[fft_shape] = spectrum
+        return spectrum
+
+    @property
+    def nbytes(self) -> int:
+        return self.zero_mean.nbytes + sum(s.nbytes for s in self.spectra.values())
+
+
+class FFTCorrelator:
+    """
+    频域批量相关器
+    构造时按尺寸对模板分组；match() 每帧只做一次帧 FFT，每个模板只需一次频域乘法与逆 FFT。
+    模板频谱随帧尺寸缓存，同一 ROI 尺寸的后续帧不再变换模板。
+    """
+
+    def __init__(self, templates: Sequence[np.ndarray]):
+        by_shape: Dict[Tuple[int, int], List[int]] = OrderedDict()
+        for index, template in enumerate(templates):
+            by_shape.setdefault(template.shape[:2], []).append(index)
+        self.groups = [_SizeGroup(indices, [templates[i] for i in indices]) for indices in by_shape.values()]
+        self.count = len(templates)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(group.nbytes for group in self.groups)
+
+    def match(self, image: np.ndarray) -> Iterator[Tuple[int, np.ndarray]]:
+        """逐个产出 (模板下标, 得分图)；大于图像的模板跳过"""
+        img_h, img_w = image.shape[:2]
+        fft_shape = (scipy.fft.next_fast_len(img_h, real=True), scipy.fft.next_fast_len(img_w, real=True))
+        # 去掉全图均值不改变分子（模板已去均值），但能减小 float32 频域计算的舍入误差
+        centered = image.astype(np.float32)
+        centered -= centered.mean()
+        frame_spectrum = None
+        sums, squares = cv2.integral2(image, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+
+        for group in self.groups:
+            th, tw = group.shape
+            if th > img_h or tw > img_w:
+                continue
+            if frame_spectrum is None:
+                frame_spectrum = scipy.fft.rfft2(centered, s=fft_shape)
+            out_h, out_w = img_h - th + 1, img_w - tw + 1
+            spectra = group.spectrum(fft_shape)
+            product = np.empty_like(frame_spectrum)
+
+            # 窗口内 sum(I^2) - sum(I)^2 / n，即 n 倍方差
+            window_sum = sums[th:, tw:] - sums[:-th, tw:] - sums[th:, :-tw] + sums[:-th, :-tw]
+            window_sq = squares[th:, tw:] - squares[:-th, tw:] - squares[th:, :-tw] + squares[:-th, :-tw]
+            window_std = np.sqrt(np.maximum(window_sq - window_sum ** 2 / (th * tw), 0))
+            inv_window_std = np.zeros(window_std.shape, dtype=np.float32)
+            np.divide(1.0, window_std, out=inv_window_std, where=window_std > 0, casting="unsafe")
+
+            # 逆变换逐模板进行：整组一次性逆变换受内存带宽限制，反而更慢
+            for slot, index in enumerate(group.indices):
+                np.multiply(frame_spectrum, spectra[slot], out=product)
+                correlation = scipy.fft.irfft2(product, s=fft_shape, overwrite_x=True)
+                numerator = np.ascontiguousarray(correlation[:out_h, :out_w])
+                yield index, _normalize_scores(numerator, inv_window_std, group.norms[slot])
+
+
+def correlate(image: np.ndarray, templates: Sequence[np.ndarray], backend: str = "opencv",
+              correlator: FFTCorrelator = None, arena=None) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    统一入口：逐个产出 (模板下标, TM_CCOEFF_NORMED 得分图)
+    backend="fft" 时可传入预先构建的 correlator 以复用模板频谱；
+    backend="opencv" 时可传入 BufferArena，同尺寸得分图写入同一缓冲区（下一个模板产出前有效）
+    """
+    if backend == "fft":
+        yield from (correlator or FFTCorrelator(templates)).match(image)
+        return
+    if backend != "opencv":
+        raise ValueError(f"未知的相关匹配后端: {backend}（可选: {', '.join(CORRELATION_BACKENDS)}）")
+    img_h, img_w = image.shape[:2]
+    for index, template in enumerate(templates):
+        if template.shape[0] > img_h or template.shape[1] > img_w:
+            continue
+        result = None
+        if arena is not None:
+            result = arena.get("score", (img_h - template.shape[0] + 1, img_w - template.shape[1] + 1), np.float32)
+        yield index, cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED, result=result)
@@ -0,0 +1,104 @@
+"""
+节点窗口内容缓存模块
+截图不含动画时，同一棋子的窗口像素在帧与帧之间完全相同。
+以窗口内容（灰度 + 颜色标签）的哈希为键缓存识别结果，命中时直接跳过模板匹配。
+"""
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple, Any
+
+import numpy as np
+
+# 缺失标记：区分“未缓存”与“缓存结果为空位（None）”
+_MISSING = object()
+
+
+class CropCache:
+    """
+    内容哈希 LRU 缓存
+    - 键: (窗口字节的 blake2b 摘要, 窗口形状, 调用方附加的区分键)，精确匹配，不做感知哈希近似
+    - 值: 小对象（如相对窗口的最佳匹配记录，空位为 None）
+    - 占用按条目估算，超过 max_bytes 时淘汰最久未用的条目
+    - 结果依赖的全局参数（模板图集、阈值等）由 bind() 绑定，变化时整体清空
+    - 各方法由内部锁保护，可被并发的识别调用（连续识别 + 手动识别）共用；get/put 传入 context 时，
+      缓存已被其他调用改绑则视为未命中、不写入，不同参数的结果不会混用
+    """
+    # 每个条目的固定开销估计（OrderedDict 槽位、键元组等）
+    ENTRY_OVERHEAD = 160
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, Tuple[Any, int]]" = OrderedDict()
+        self._context: Optional[Hashable] = None
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(crop: np.ndarray, extra: Hashable = None) -> Tuple:
+        """窗口内容键；crop 可以是非连续视图"""
+        digest = hashlib.blake2b(np.ascontiguousarray(crop).data, digest_size=16).digest()
+        return digest, crop.shape, extra
+
+    def bind(self, context: Hashable) -> None:
+        """绑定结果所依赖的全局参数；与上次不同时清空缓存"""
+        with self._lock:
+            if context != self._context:
+                self._clear()
+                self._context = context
+
+    def get(self, key: Tuple, default: Any = _MISSING, context: Any = _MISSING) -> Any:
+        """命中返回缓存值；未命中返回 default（缺省为缺失标记，用 found() 判断）"""
+        with self._lock:
+            entry = self._entries.get(key) if context is _MISSING or context == self._context else None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    @staticmethod
+    def found(value: Any) -> bool:
+        """get() 的返回值是否为命中（命中值本身可能是 None）"""
+        return value is not _MISSING
+
+    def put(self, key: Tuple, value: Any, context: Any = _MISSING) -> None:
+        size = self.ENTRY_OVERHEAD + sys.getsizeof(key[0]) + sys.getsizeof(value)
+        with self._lock:
+            if context is not _MISSING and context != self._context:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.nbytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "hit_rate": self.hit_rate}
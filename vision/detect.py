@@ -8,13 +8,13 @@ import numpy as np
 import os
 from pathlib import Path
 
-from src.vision.utils import (
-    preprocess_image, enhance_contrast, remove_noise,
+from vision.utils import (
+    preprocess_image, remove_noise,
     adaptive_threshold, morphological_operations, non_max_suppression,
-    extract_cell_image, resize_with_aspect_ratio
+    extract_cell_image, resize_with_aspect_ratio, find_peaks, PreprocessPipeline
 )
-from src.vision.templates_manager import TemplatesManager
-from src.vision.ocr import confirm_label_by_ocr, OCREngine
+from vision.templates_manager import TemplatesManager
+from vision.ocr import confirm_label_by_ocr, OCREngine
 from src.board.coordinate_manager import CoordinateManager
 
 Detection = Dict[str, Any]  # {"position_key":str,"type":str|"unknown","color":str|None,
@@ -24,7 +24,8 @@ Detection = Dict[str, Any]  # {"position_key":str,"type":str|"unknown","color":s
 def detect_pieces(board_img: np.ndarray, config: dict,
                 templates_manager: Optional[TemplatesManager] = None,
                 ocr_engine: Optional[OCREngine] = None,
-                coord_manager: Optional[CoordinateManager] = None) -> List[Detection]:
+                coord_manager: Optional[CoordinateManager] = None,
+                pipeline: Optional[PreprocessPipeline] = None) -> List[Detection]:
     """
     检测棋盘上的棋子
 
@@ -34,6 +35,7 @@ def detect_pieces(board_img: np.ndarray, config: dict,
         templates_manager: 模板管理器实例
         ocr_engine: OCR引擎实例
         coord_manager: 坐标管理器实例
+        pipeline: 预处理流水线，连续检测时传入同一个实例；默认按 config['preprocess'] 构造
 
     Returns:
         检测到的棋子列表
@@ -45,15 +47,18 @@ def detect_pieces(board_img: np.ndarray, config: dict,
         map_path = Path(__file__).parent.parent / "board" / "new_coordinate_map.json"
         coord_manager = CoordinateManager(map_path)
 
+    if pipeline is None:
+        pipeline = PreprocessPipeline.from_config(config.get('preprocess'))
+
     # 获取配置参数
     match_threshold = config.get('match_threshold', 0.78)
     nms_iou = config.get('nms_iou', 0.35)
     detect_stride = config.get('detect_stride', 1)
+    max_peaks = config.get('max_peaks_per_template')
     ocr_enabled = config.get('ocr', {}).get('enable', True)
 
-    # 预处理图像
-    gray_img = preprocess_image(board_img, method='grayscale', normalize=True)
-    enhanced_img = enhance_contrast(gray_img, method='clahe')
+    # 预处理图像（灰度 → 归一化 → CLAHE）
+    enhanced_img = pipeline.apply(board_img)
 
     # 获取所有模板
     templates = templates_manager.get_all_templates()
@@ -75,7 +80,7 @@ def detect_pieces(board_img: np.ndarray, config: dict,
 
         # 执行模板匹配
         matches = _template_match(enhanced_img, template_img,
-                               match_threshold, detect_stride)
+                               match_threshold, detect_stride, max_peaks)
 
         for match in matches:
             x, y, w, h, score = match
@@ -138,7 +143,8 @@ def detect_pieces(board_img: np.ndarray, config: dict,
 
 
 def _template_match(img: np.ndarray, template: np.ndarray,
-                  threshold: float, stride: int = 1) -> List[Tuple[int, int, int, int, float]]:
+                  threshold: float, stride: int = 1,
+                  top_k: Optional[int] = None) -> List[Tuple[int, int, int, int, float]]:
     """
     执行模板匹配
 
@@ -147,6 +153,7 @@ def _template_match(img: np.ndarray, template: np.ndarray,
         template: 模板图像（灰度）
         threshold: 匹配阈值
         stride: 滑动步长
+        top_k: 最多保留的峰值数，None 表示不限制
 
     Returns:
         匹配结果列表 [(x, y, w, h, score), ...]
@@ -160,15 +167,9 @@ def _template_match(img: np.ndarray, template: np.ndarray,
     # 执行模板匹配
     result = cv2.matchTemplate(img, template, cv2.TM_CCOEFF_NORMED)
 
-    # 找到所有超过阈值的匹配
-    locations = np.where(result >= threshold)
-    matches = []
-
-    for pt in zip(*locations[::-1]):  # 切换为 (x, y) 顺序
-        score = result[pt[1], pt[0]]
-        matches.append((pt[0], pt[1], w, h, float(score)))
-
-    return matches
+    # 只取超过阈值的局部极大值
+    xs, ys, scores = find_peaks(result, threshold, top_k)
+    return [(int(x), int(y), w, h, float(score)) for x, y, score in zip(xs, ys, scores)]
 
 
 def _parse_template_name(template_name: str) -> Tuple[Optional[str], str]:
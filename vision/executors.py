@@ -0,0 +1,122 @@
+"""
+任务执行后端
+- "process": multiprocessing.Pool，绕开 GIL；帧与模板经共享内存传递，任务本身只有几十字节
+- "thread": 线程池；cv2.matchTemplate 等 OpenCV/numpy 运算会释放 GIL，无进程间开销
+- "serial": 在调用线程内逐个执行，没有任何调度开销，适合很小的工作量
+- "auto": 按工作量（搜索像素数 x 模板数）选择：小于 serial_work 时串行，否则交给进程池
+所有后端提供相同的 map(fn, tasks, work=None) -> list 接口，以及按完成顺序逐个产出结果的
+imap_unordered(fn, tasks, work=None)，供父进程边接收边合并。
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import Pool
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+EXECUTOR_BACKENDS = ("process", "thread", "serial", "auto")
+
+
+class SerialExecutor:
+    """调用线程内顺序执行；initializer 只执行一次"""
+    kind = "serial"
+
+    def __init__(self, initializer: Optional[Callable] = None, initargs: Tuple = ()):
+        if initializer is not None:
+            initializer(*initargs)
+        self.workers = 1
+
+    def map(self, fn: Callable, tasks: Sequence, work: Optional[int] = None) -> List[Any]:
+        return [fn(task) for task in tasks]
+
+    def imap_unordered(self, fn: Callable, tasks: Sequence, work: Optional[int] = None) -> Iterator[Any]:
+        return (fn(task) for task in tasks)
+
+    def close(self) -> None:
+        pass
+
+
+class ThreadExecutor:
+    """线程池；工作函数通过共享内存句柄取帧，与进程池共用同一套工作函数"""
+    kind = "thread"
+
+    def __init__(self, workers: int, initializer: Optional[Callable] = None, initargs: Tuple = ()):
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analyzer",
+                                        initializer=initializer, initargs=initargs)
+
+    def map(self, fn: Callable, tasks: Sequence, work: Optional[int] = None) -> List[Any]:
+        if len(tasks) <= 1:
+            return [fn(task) for task in tasks]
+        return list(self._pool.map(fn, tasks))
+
+    def imap_unordered(self, fn: Callable, tasks: Sequence, work: Optional[int] = None) -> Iterator[Any]:
+        futures = [self._pool.submit(fn, task) for task in tasks]
+        return (future.result() for future in as_completed(futures))
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+class ProcessExecutor:
+    """进程池（需在共享内存创建之后构造，见 shm_transport._ensure_resource_tracker）"""
+    kind = "process"
+
+    def __init__(self, workers: int, initializer: Optional[Callable] = None, initargs: Tuple = ()):
+        self.workers = workers
+        self._pool = Pool(processes=workers, initializer=initializer, initargs=initargs)
+
+    def map(self, fn: Callable, tasks: Sequence, work: Optional[int] = None) -> List[Any]:
+        # chunksize=1: 工作进程逐个领取任务，配合按代价降序排列的任务即最长任务优先调度
+        return self._pool.map(fn, tasks, chunksize=1) if tasks else []
+
+    def imap_unordered(self, fn: Callable, tasks: Sequence, work: Optional[int] = None) -> Iterator[Any]:
+        return self._pool.imap_unordered(fn, tasks, chunksize=1) if tasks else iter(())
+
+    def worker_pids(self) -> List[int]:
+        return [process.pid for process in self._pool._pool]
+
+    def close(self) -> None:
+        self._pool.close()
+        self._pool.join()
+
+
+class AutoExecutor:
+    """按工作量选择后端：节点窗口、先验复核等小工作量直接串行，整帧/区域匹配交给进程池"""
+    kind = "auto"
+
+    def __init__(self, workers: int, initializer: Optional[Callable] = None, initargs: Tuple = (),
+                 serial_work: int = 2_000_000):
+        self.workers = workers
+        self.serial_work = serial_work
+        # 进程池在构造时创建：GUI 线程启动后再 fork 并不安全
+        self._process = ProcessExecutor(workers, initializer, initargs)
+        self._serial = SerialExecutor(initializer, initargs)
+        self.last_kind: Optional[str] = None
+
+    def _select(self, work: Optional[int]):
+        executor = self._serial if work is not None and work < self.serial_work else self._process
+        self.last_kind = executor.kind
+        return executor
+
+    def map(self, fn: Callable, tasks: Sequence, work: Optional[int] = None) -> List[Any]:
+        return self._select(work).map(fn, tasks, work)
+
+    def imap_unordered(self, fn: Callable, tasks: Sequence, work: Optional[int] = None) -> Iterator[Any]:
+        return self._select(work).imap_unordered(fn, tasks, work)
+
+    def worker_pids(self) -> List[int]:
+        return self._process.worker_pids()
+
+    def close(self) -> None:
+        self._process.close()
+
+
+def create_executor(kind: str, workers: int, initializer: Optional[Callable] = None, initargs: Tuple = ()):
+    """按名字创建执行后端"""
+    if kind == "process":
+        return ProcessExecutor(workers, initializer, initargs)
+    if kind == "thread":
+        return ThreadExecutor(workers, initializer, initargs)
+    if kind == "serial":
+        return SerialExecutor(initializer, initargs)
+    if kind == "auto":
+        return AutoExecutor(workers, initializer, initargs)
+    raise ValueError(f"未知的执行后端: {kind}（可选: {', '.join(EXECUTOR_BACKENDS)}）")
@@ -6,10 +6,25 @@ import numpy as np
 import cv2
 from paddleocr import PaddleOCR
 
+from vision.utils import PreprocessPipeline
+
+# OCR 预处理默认参数：灰度 → 自适应阈值 → 闭运算 → 开运算（2x2 矩形核）
+OCR_PREPROCESS = {
+    "normalize": False,
+    "contrast": None,
+    "threshold": "gaussian",
+    "block_size": 11,
+    "c": 2,
+    "morphology": ("close", "open"),
+    "kernel_shape": "rect",
+    "kernel_size": 2,
+}
+
 
 class OCREngine:
     def __init__(self, lang: str = "ch", use_gpu: bool = False,
-                 det_limit_side_len: int = 960, rec_batch_size: int = 8):
+                 det_limit_side_len: int = 960, rec_batch_size: int = 8,
+                 preprocess: Optional[dict] = None):
         """
         初始化 PaddleOCR 引擎
 
@@ -18,11 +33,13 @@ class OCREngine:
             use_gpu: 是否使用 GPU
             det_limit_side_len: 检测边长限制
             rec_batch_size: 识别批处理大小
+            preprocess: 预处理参数，覆盖 OCR_PREPROCESS 中的同名项
         """
         self.lang = lang
         self.use_gpu = use_gpu
         self.det_limit_side_len = det_limit_side_len
         self.rec_batch_size = rec_batch_size
+        self.pipeline = PreprocessPipeline.from_config({**OCR_PREPROCESS, **(preprocess or {})})
 
         # 初始化 PaddleOCR
         try:
@@ -52,24 +69,8 @@ class OCREngine:
             scale = max(2, min(4, 100 // min(image.shape[:2])))
             image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
 
-        # 转换为灰度图像
-        if len(image.shape) == 3:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = image
-
-        # 自适应阈值处理
-        binary = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2
-        )
-
-        # 形态学去噪
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-        denoised = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-        denoised = cv2.morphologyEx(denoised, cv2.MORPH_OPEN, kernel)
-
-        return denoised
+        # 灰度、自适应阈值、形态学去噪
+        return self.pipeline.apply(image)
 
     def read_text(self, image: np.ndarray,
                   roi: Optional[Tuple[int, int, int, int]] = None) -> Tuple[str, float]:
@@ -0,0 +1,90 @@
+"""
+任务划分与代价模型
+- 代价单位 = 搜索像素数 x 模板像素数（matchTemplate 的工作量近似与二者乘积成正比）
+- TaskCostModel 以每单位秒数估计任务耗时，按实测帧耗时做指数滑动平均校准
+- balance_tasks 按估计代价从大到小排序（最长任务优先），配合逐个领取任务的执行后端，
+  各核心几乎同时结束
+"""
+import math
+from typing import List, Sequence, Tuple
+
+
+class TaskCostModel:
+    """
+    matchTemplate 代价模型: 秒数 ≈ seconds_per_unit x 搜索像素数 x 模板像素数
+    observe() 用实测的 (总代价单位, 墙钟耗时, 并行度) 校准系数
+    """
+
+    def __init__(self, seconds_per_unit: float = 4e-11, smoothing: float = 0.2):
+        self.seconds_per_unit = seconds_per_unit
+        self.smoothing = smoothing
+
+    def estimate(self, units: float) -> float:
+        return units * self.seconds_per_unit
+
+    def observe(self, units: float, seconds: float, parallelism: int) -> None:
+        """墙钟耗时 x 实际并行度 ≈ 总计算时间；单位数过小时测量被调度开销主导，不参与校准"""
+        if units <= 0 or seconds <= 0 or self.estimate(units) < 1e-3:
+            return
+        measured = seconds * max(parallelism, 1) / units
+        self.seconds_per_unit += self.smoothing * (measured - self.seconds_per_unit)
+
+
+def split_rows(roi: Tuple[int, int, int, int], template_h: int, parts: int) -> List[Tuple[int, int, int, int]]:
+    """
+    把搜索区域按行切成 parts 条，得分图的行互不重叠：每条的搜索区域向下多带 template_h - 1 行。
+    每条至少保留 template_h 行得分图，避免切得过碎。
+    """
+    x, y, w, h = roi
+    out_h = h - template_h + 1
+    parts = max(1, min(parts, out_h // max(template_h, 1)))
+    if parts == 1 or out_h <= 0:
+        return [roi]
+    bounds = [round(i * out_h / parts) for i in range(parts + 1)]
+    return [(x, y + r0, w, r1 - r0 + template_h - 1) for r0, r1 in zip(bounds[:-1], bounds[1:])]
+
+
+def pad_strips(roi: Tuple[int, int, int, int], strips: Sequence[Tuple[int, int, int, int]],
+               context: int) -> List[Tuple[Tuple[int, int, int, int], Tuple[int, int]]]:
+    """
+    给 split_rows 的条带补上峰值判定所需的上下文，返回 [(搜索区域, (起始 y, 结束 y))]。
+    搜索区域上下各多带 context 行（不超出 roi），条带边缘的局部极大值判定与整幅得分图一致；
+    (起始 y, 结束 y) 为本条负责的匹配左上角 y 范围（帧坐标，左闭右开），相邻条带互不重叠且覆盖整个 roi。
+    """
+    x, y, w, h = roi
+    starts = [strip[1] for strip in strips[1:]]
+    padded = []
+    for (sx, sy, sw, sh), start, end in zip(strips, [y] + starts, starts + [y + h]):
+        top, bottom = max(sy - context, y), min(sy + sh + context, y + h)
+        padded.append(((sx, top, sw, bottom - top), (start, end)))
+    return padded
+
+
+def chunk_units(costs: Sequence[float], target: float) -> List[List[int]]:
+    """
+    按顺序把单元（模板或相似模板簇）分成 ceil(总代价 / target) 块，返回每块的单元下标。
+    单元按累计代价的中点归块，各块代价尽量相等。
+    """
+    total = sum(costs)
+    if not costs or total <= 0 or not math.isfinite(target):
+        return [list(range(len(costs)))] if costs else []
+    parts = max(1, math.ceil(total / target - 1e-9))
+    chunks: List[List[int]] = [[] for _ in range(parts)]
+    cumulative = 0.0
+    for index, cost in enumerate(costs):
+        chunks[min(int((cumulative + cost / 2) / total * parts), parts - 1)].append(index)
+        cumulative += cost
+    return [chunk for chunk in chunks if chunk]
+
+
+def balance_tasks(tasks: Sequence, costs: Sequence[float]) -> List:
+    """最长任务优先：按估计代价降序排列"""
+    order = sorted(range(len(tasks)), key=lambda i: -costs[i])
+    return [tasks[i] for i in order]
+
+
+def target_task_cost(total_cost: float, workers: int, tasks_per_worker: int = 8, min_cost: float = 0.005) -> float:
+    """每个任务的目标代价（秒）：单核不拆分；多核时每核约 tasks_per_worker 个任务（越细越均衡，但每个任务有固定调度开销），但不小于 min_cost"""
+    if workers <= 1:
+        return math.inf
+    return max(total_cost / (workers * tasks_per_worker), min_cost)
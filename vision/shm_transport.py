@@ -0,0 +1,248 @@
+"""
+共享内存传输模块
+- 帧: 父进程把每帧截图发布到可复用的共享内存环形缓冲区，
+  工作进程只接收 (共享内存名, 槽位, 形状, 类型) 句柄并零拷贝地映射为 numpy 数组，
+  避免 Pool.map 每个任务都 pickle 一份完整截图。
+- 模板: 编译后的模板打包为只读图集，工作进程启动时附加一次，任务中只传模板 ID。
+"""
+import os
+import threading
+import itertools
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import NamedTuple, Tuple, List, Optional, Dict, Sequence, Iterator
+
+import numpy as np
+
+_ring_counter = itertools.count()
+
+
+class FrameHandle(NamedTuple):
+    """跨进程传递的帧句柄（仅几十字节）"""
+    shm_name: str
+    slot: int
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def _ensure_resource_tracker() -> None:
+    """
+    POSIX 下共享内存由 resource_tracker 登记回收。必须在创建进程池之前启动它，
+    这样 fork 出的工作进程会共用父进程的 tracker；否则每个工作进程各自启动一个，
+    并在退出时把父进程仍在使用的共享内存当作泄漏 unlink 掉。
+    """
+    if os.name == "nt":
+        return
+    from multiprocessing import resource_tracker
+    resource_tracker.ensure_running()
+
+
+class SharedFrameRing:
+    """
+    共享内存帧环形缓冲区
+    - 每个槽位对应一块共享内存，容量不足时按需扩容（换新名字，旧块立即释放）
+    - 多个线程同时分析时（如连续识别与手动识别并发），最多 slots 帧互不覆盖
+    - 需在创建进程池之前构造（见 _ensure_resource_tracker）
+    """
+
+    def __init__(self, slots: int = 2):
+        _ensure_resource_tracker()
+        self.slots = slots
+        self._ring_id = f"sgjq_{os.getpid()}_{next(_ring_counter)}"
+        self._buffers: List[Optional[shared_memory.SharedMemory]] = [None] * slots
+        self._generations = [0] * slots
+        self._next_slot = 0
+        self._lock = threading.Lock()
+
+    def _ensure_capacity(self, slot: int, nbytes: int) -> shared_memory.SharedMemory:
+        shm = self._buffers[slot]
+        if shm is not None and shm.size >= nbytes:
+            return shm
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        self._generations[slot] += 1
+        name = f"{self._ring_id}_{slot}_{self._generations[slot]}"
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(nbytes, 1))
+        self._buffers[slot] = shm
+        return shm
+
+    def publish(self, frame: np.ndarray) -> FrameHandle:
+        """把帧复制进下一个槽位（一次 memcpy），返回可跨进程传递的句柄"""
+        with self._lock:
+            slot = self._next_slot
+            self._next_slot = (self._next_slot + 1) % self.slots
+            shm = self._ensure_capacity(slot, frame.nbytes)
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=shm.buf)
+        np.copyto(view, frame)
+        return FrameHandle(shm.name, slot, tuple(frame.shape), frame.dtype.str)
+
+    def close(self) -> None:
+        with self._lock:
+            for i, shm in enumerate(self._buffers):
+                if shm is None:
+                    continue
+                try:
+                    shm.close()
+                    shm.unlink()
+                except (FileNotFoundError, BufferError):
+                    pass
+                self._buffers[i] = None
+
+
+# --- 工作进程侧 ---
+# 每个工作进程缓存已附加的共享内存，避免每个任务都重新 mmap。
+# 线程/串行执行后端下这些缓存在分析线程之间共享，由 _attach_lock 保护
+_MAX_ATTACHED = 16
+_attached: "OrderedDict[str, shared_memory.SharedMemory]" = OrderedDict()
+_attach_lock = threading.Lock()
+
+
+def attach_frame(handle: FrameHandle) -> np.ndarray:
+    """在工作进程中把句柄映射为只读 numpy 视图（零拷贝）"""
+    with _attach_lock:
+        shm = _attach_shm(handle.shm_name)
+    frame = np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=shm.buf)
+    frame.flags.writeable = False
+    return frame
+
+
+def _attach_shm(name: str) -> shared_memory.SharedMemory:
+    shm = _attached.get(name)
+    if shm is None:
+        # 工作进程与父进程共用同一个 resource_tracker，附加时的重复登记是幂等的，
+        # 回收仍由父进程的 SharedFrameRing.close() 负责
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = shm
+        while len(_attached) > _MAX_ATTACHED:
+            _, stale = _attached.popitem(last=False)
+            try:
+                stale.close()
+            except BufferError:
+                pass
+    else:
+        _attached.move_to_end(name)
+    return shm
+
+
+class TemplateAtlas:
+    """
+    只读模板图集：所有编译模板的掩码灰度图拼接为一块连续共享内存，
+    N 个工作进程共享同一份物理内存，任务中只用整数模板 ID 引用模板。
+
+    共享内存布局（全部小端）:
+        [int64 N][int64 表 N x 4: 像素偏移, 高, 宽, 是否为空][float64 统计 N x 2: 均值, 范数][uint8 像素]
+    """
+    TABLE_COLUMNS = 4
+    STATS_COLUMNS = 2
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        count = int(np.ndarray((1,), dtype="<i8", buffer=shm.buf)[0])
+        table_end = 8 + count * self.TABLE_COLUMNS * 8
+        stats_end = table_end + count * self.STATS_COLUMNS * 8
+        self.table = np.ndarray((count, self.TABLE_COLUMNS), dtype="<i8", buffer=shm.buf, offset=8)
+        self.stats = np.ndarray((count, self.STATS_COLUMNS), dtype="<f8", buffer=shm.buf, offset=table_end)
+        self.pixels = np.ndarray((shm.size - stats_end,), dtype=np.uint8, buffer=shm.buf, offset=stats_end)
+        if not owner:
+            for array in (self.table, self.stats, self.pixels):
+                array.flags.writeable = False
+        # 解析后的视图缓存，避免每帧重复切片
+        self._views: Dict[int, np.ndarray] = {}
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    @classmethod
+    def build(cls, compiled_templates: Sequence) -> "TemplateAtlas":
+        """由父进程从编译模板列表（下标即模板 ID）构建图集"""
+        _ensure_resource_tracker()
+        count = len(compiled_templates)
+        grays = [np.ascontiguousarray(c.gray) for c in compiled_templates]
+        header_bytes = 8 + count * (cls.TABLE_COLUMNS + cls.STATS_COLUMNS) * 8
+        pixel_bytes = sum(g.nbytes for g in grays)
+        name = f"sgjq_atlas_{os.getpid()}_{next(_ring_counter)}"
+        shm = shared_memory.SharedMemory(name=name, create=True, size=header_bytes + max(pixel_bytes, 1))
+
+        np.ndarray((1,), dtype="<i8", buffer=shm.buf)[0] = count
+        atlas = cls(shm, owner=True)
+        offset = 0
+        for template_id, (compiled, gray) in enumerate(zip(compiled_templates, grays)):
+            h, w = gray.shape[:2]
+            atlas.table[template_id] = (offset, h, w, int(compiled.is_empty))
+            atlas.stats[template_id] = (compiled.mean, compiled.norm)
+            atlas.pixels[offset:offset + gray.nbytes] = gray.ravel()
+            offset += gray.nbytes
+        return atlas
+
+    @classmethod
+    def attach(cls, name: str) -> "TemplateAtlas":
+        """工作进程按名字附加图集（零拷贝）"""
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    def image(self, template_id: int) -> np.ndarray:
+        view = self._views.get(template_id)
+        if view is None:
+            offset, h, w, _ = (int(v) for v in self.table[template_id])
+            view = self.pixels[offset:offset + h * w].reshape(h, w)
+            self._views[template_id] = view
+        return view
+
+    def is_empty(self, template_id: int) -> bool:
+        return bool(self.table[template_id, 3])
+
+    def close(self) -> None:
+        self._views.clear()
+        self.table = self.stats = self.pixels = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except (FileNotFoundError, BufferError):
+            pass
+
+
+# 每个工作进程（线程/串行后端下为本进程所有分析线程共用）已附加的图集: 名字 -> [图集, 正在使用的任务数]。
+# 模板库重建后新旧名字的任务可能同时在跑，旧图集在最后一个使用它的任务结束后才关闭
+_worker_atlases: "OrderedDict[str, list]" = OrderedDict()
+
+
+def attach_atlas(name: str) -> TemplateAtlas:
+    """附加图集并设为最新（进程池 initializer 预先附加用）；任务中请用 use_atlas"""
+    with _attach_lock:
+        slot = _worker_atlases.get(name)
+        if slot is None:
+            slot = _worker_atlases[name] = [TemplateAtlas.attach(name), 0]
+        _worker_atlases.move_to_end(name)
+        _close_idle_atlases()
+        return slot[0]
+
+
+@contextmanager
+def use_atlas(name: str) -> Iterator[TemplateAtlas]:
+    """任务执行期间占用图集：其他任务换绑到新名字时不会关闭仍在使用的旧图集"""
+    with _attach_lock:
+        slot = _worker_atlases.get(name)
+        if slot is None:
+            slot = _worker_atlases[name] = [TemplateAtlas.attach(name), 0]
+        _worker_atlases.move_to_end(name)
+        slot[1] += 1
+    try:
+        yield slot[0]
+    finally:
+        with _attach_lock:
+            slot[1] -= 1
+            _close_idle_atlases()
+
+
+def _close_idle_atlases() -> None:
+    """关闭不是最新、且没有任务在用的图集（调用方持有 _attach_lock）"""
+    latest = next(reversed(_worker_atlases), None)
+    for name in [n for n, (_, users) in _worker_atlases.items() if n != latest and users == 0]:
+        _worker_atlases.pop(name)[0].close()
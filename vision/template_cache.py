@@ -0,0 +1,135 @@
+"""
+模板库磁盘缓存模块
+将解码后的模板图像及预编译结果保存为单个 .npz 文件，加速冷启动。
+- 每个条目以 (分区, 模板名) 标识，并带有失效键（文件大小、修改时间、颜色范围等）
+- 键不一致的条目视为失效，只重建变化的条目
+"""
+import io
+import json
+import os
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Iterable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 缓存格式版本：格式或预处理算法变化时递增，旧缓存将整体失效
+CACHE_VERSION = 1
+
+
+def file_key(file_path: Path) -> str:
+    """文件失效键：大小 + 纳秒级修改时间"""
+    stat = file_path.stat()
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def params_key(params: object) -> str:
+    """参数失效键：对 JSON 可序列化参数取短哈希"""
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class TemplateCache:
+    """
+    单文件 .npz 模板缓存
+    - 条目结构: {"key": 失效键, "meta": 任意 JSON 元数据, 数组字段...}
+    - 同一 (分区, 字段) 的所有数组拼接为一个连续缓冲区 "{section}/{field}"，
+      条目只记录 (偏移, 形状, 类型)，读取时一次载入、按视图切分
+    - 元数据保存在 "__meta__" 中
+    """
+
+    def __init__(self, cache_path: Path):
+        self.cache_path = Path(cache_path)
+        self.entries: Dict[Tuple[str, str], Dict] = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self) -> None:
+        if not self.cache_path.is_file():
+            return
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                meta = json.loads(str(data["__meta__"]))
+                if meta.get("version") != CACHE_VERSION:
+                    logger.info("模板缓存版本不一致，将重建。")
+                    self.dirty = True
+                    return
+                buffers = {name: data[name] for name in data.files if name != "__meta__"}
+                for record in meta["entries"]:
+                    arrays = {}
+                    for field, (offset, shape, dtype) in record["fields"].items():
+                        flat = buffers[f"{record['section']}/{field}"]
+                        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+                        arrays[field] = flat[offset:offset + size].view(dtype).reshape(shape)
+                    self.entries[(record["section"], record["name"])] = {
+                        "key": record["key"], "meta": record["meta"], "arrays": arrays
+                    }
+        except Exception as e:
+            logger.warning(f"模板缓存读取失败，将重建: {e}")
+            self.entries.clear()
+            self.dirty = True
+
+    def get(self, section: str, name: str, key: str) -> Optional[Tuple[Dict[str, np.ndarray], Dict]]:
+        """返回 (数组字段, 元数据)；键不一致或不存在时返回 None"""
+        entry = self.entries.get((section, name))
+        if entry is None or entry["key"] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["arrays"], entry["meta"]
+
+    def put(self, section: str, name: str, key: str,
+            arrays: Dict[str, np.ndarray], meta: Optional[Dict] = None) -> None:
+        self.entries[(section, name)] = {"key": key, "meta": meta or {}, "arrays": arrays}
+        self.dirty = True
+
+    def prune(self, section: str, keep_names: Iterable[str]) -> None:
+        """删除分区内已不存在的模板条目"""
+        keep = set(keep_names)
+        stale = [k for k in self.entries if k[0] == section and k[1] not in keep]
+        for k in stale:
+            del self.entries[k]
+        if stale:
+            self.dirty = True
+
+    def save(self) -> None:
+        """仅在有变化时写回；先写临时文件再原子替换，避免多实例并发读到半个文件"""
+        if not self.dirty:
+            return
+        records = []
+        chunks: Dict[str, list] = {}
+        offsets: Dict[str, int] = {}
+        for (section, name), entry in self.entries.items():
+            fields = {}
+            for field, array in entry["arrays"].items():
+                buffer_name = f"{section}/{field}"
+                raw = np.ascontiguousarray(array).view(np.uint8).ravel()
+                offset = offsets.get(buffer_name, 0)
+                fields[field] = (offset, list(array.shape), array.dtype.str)
+                chunks.setdefault(buffer_name, []).append(raw)
+                offsets[buffer_name] = offset + raw.size
+            records.append({
+                "section": section, "name": name, "key": entry["key"],
+                "meta": entry["meta"], "fields": fields
+            })
+        payload: Dict[str, np.ndarray] = {name: np.concatenate(parts) for name, parts in chunks.items()}
+        payload["__meta__"] = np.array(json.dumps(
+            {"version": CACHE_VERSION, "entries": records}, ensure_ascii=False))
+
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            buffer = io.BytesIO()
+            np.savez(buffer, **payload)
+            tmp_path = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(buffer.getvalue())
+            os.replace(tmp_path, self.cache_path)
+            self.dirty = False
+            logger.info(f"模板缓存已写入: {self.cache_path} ({len(records)} 个条目)")
+        except OSError as e:
+            logger.warning(f"模板缓存写入失败: {e}")
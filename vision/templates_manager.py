@@ -2,12 +2,15 @@
 模板库管理模块 (v5 - 最终标准版)
 仅处理规范的英文文件名: {color}_{piece}_{position}_{index}.png
 """
+import math
 import cv2
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Sequence
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
+
+from vision.template_cache import TemplateCache, file_key, params_key
 
 logger = logging.getLogger(__name__)
 
@@ -24,15 +27,214 @@ class Template:
     filename: str
     orientation: str = "horizontal"  # 默认方向
 
+@dataclass
+class CompiledTemplate:
+    """
+    按所属颜色预处理后的模板
+    - gray: HSV 颜色掩码后的灰度模板，可直接用于 matchTemplate
+    - mask: 模板自身的 HSV 颜色掩码
+    - is_empty: 掩码后全黑（无法参与匹配）
+    - mean / norm: 去均值后的 NCC 统计量 (均值, 去均值 L2 范数)
+    """
+    template: Template
+    gray: np.ndarray
+    mask: np.ndarray
+    is_empty: bool
+    mean: float
+    norm: float
+
+    @property
+    def color(self) -> str:
+        return self.template.color
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.template.shape
+
+@dataclass
+class TemplateCluster:
+    """
+    相似模板簇（同颜色、同方向、同尺寸）
+    - representative: 代表模板 ID（到其余成员最大夹角最小的成员）
+    - members: 成员模板 ID（含代表）
+    - radius: 代表到各成员的最大夹角（弧度）；去均值归一化后向量夹角的余弦即 TM_CCOEFF_NORMED
+    """
+    representative: int
+    members: List[int]
+    radius: float
+
+    def representative_threshold(self, threshold: float) -> float:
+        """
+        代表模板的无损放行阈值：由球面三角不等式 angle(w, m) >= angle(w, r) - radius，
+        代表得分低于 cos(arccos(threshold) + radius) 的位置，任何成员都不可能达到 threshold
+        """
+        angle = math.acos(min(max(threshold, -1.0), 1.0)) + self.radius
+        return math.cos(min(angle, math.pi))
+
+@dataclass
+class TemplateBank:
+    """
+    编译后的模板库，按颜色分组
+    - entries: 全部编译模板，下标即模板 ID
+    - by_color: 颜色 -> 该颜色模板的 ID 列表
+    - clusters: 相似模板层级（见 build_hierarchy），用于级联剔除
+    - similarity: 每个模板与同组最相似模板的得分（见 sibling_similarity），用于先验复核阈值
+    """
+    entries: List[CompiledTemplate] = field(default_factory=list)
+    by_color: Dict[str, List[int]] = field(default_factory=dict)
+    clusters: List[TemplateCluster] = field(default_factory=list)
+    similarity: Optional[np.ndarray] = None
+
+    def clusters_for(self, template_ids: Sequence[int]) -> List[TemplateCluster]:
+        """给定模板 ID 子集内的簇（成员按子集过滤，代表不在子集内的簇整体跳过）"""
+        wanted = set(template_ids)
+        return [TemplateCluster(c.representative, [m for m in c.members if m in wanted], c.radius)
+                for c in self.clusters if c.representative in wanted]
+
+    def for_color(self, color: str, include_empty: bool = False,
+                  orientations: Optional[Sequence[str]] = None) -> List[CompiledTemplate]:
+        return [self.entries[i] for i in self.ids_for_color(color, include_empty, orientations)]
+
+    def ids_for_color(self, color: str, include_empty: bool = False,
+                      orientations: Optional[Sequence[str]] = None) -> List[int]:
+        """orientations 为 None 时返回所有方向的模板"""
+        return [i for i in self.by_color.get(color, [])
+                if (include_empty or not self.entries[i].is_empty)
+                and (orientations is None or self.entries[i].template.orientation in orientations)]
+
+    def colors(self) -> List[str]:
+        return list(self.by_color.keys())
+
+    def downscaled(self, factor: int) -> "TemplateBank":
+        """
+        按整数倍缩小的模板库（金字塔粗匹配用），模板 ID 与原库一一对应。
+        缩小的是掩码后的灰度图（INTER_AREA），与帧侧先全分辨率掩码、再缩小的处理一致。
+        """
+        entries = []
+        for entry in self.entries:
+            h, w = entry.gray.shape[:2]
+            size = (max(w // factor, 1), max(h // factor, 1))
+            gray = cv2.resize(entry.gray, size, interpolation=cv2.INTER_AREA)
+            mask = cv2.resize(entry.mask, size, interpolation=cv2.INTER_NEAREST)
+            mean, norm = _ncc_stats(gray)
+            entries.append(CompiledTemplate(entry.template, gray, mask, entry.is_empty or not gray.any(), mean, norm))
+        return TemplateBank(entries=entries, by_color={c: list(ids) for c, ids in self.by_color.items()})
+
+def build_hierarchy(bank: TemplateBank, max_radius: float) -> List[TemplateCluster]:
+    """
+    按 (颜色, 方向, 尺寸) 分组，对组内非空模板做全链接层次聚类（距离为去均值向量夹角），
+    在 max_radius 处切分为簇；簇代表取到其余成员最大夹角最小的成员（medoid）。
+    """
+    from scipy.cluster.hierarchy import linkage, fcluster
+    from scipy.spatial.distance import squareform
+
+    groups: Dict[Tuple, List[int]] = {}
+    for template_id, entry in enumerate(bank.entries):
+        if entry.is_empty:
+            continue
+        groups.setdefault((entry.color, entry.template.orientation, entry.gray.shape), []).append(template_id)
+
+    clusters = []
+    for ids in groups.values():
+        if len(ids) == 1:
+            clusters.append(TemplateCluster(ids[0], ids, 0.0))
+            continue
+        vectors = np.stack([bank.entries[i].gray.astype(np.float64).ravel() for i in ids])
+        vectors -= vectors.mean(axis=1, keepdims=True)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        angles = np.arccos(np.clip(vectors @ vectors.T, -1.0, 1.0))
+        np.fill_diagonal(angles, 0.0)
+        labels = fcluster(linkage(squareform(angles, checks=False), method="complete"), max_radius, criterion="distance")
+        for label in np.unique(labels):
+            local = np.flatnonzero(labels == label)
+            spread = angles[np.ix_(local, local)].max(axis=1)
+            center = local[int(np.argmin(spread))]
+            clusters.append(TemplateCluster(ids[center], [ids[k] for k in local], float(spread.min())))
+    return clusters
+
+def sibling_similarity(bank: TemplateBank, shift: int = 3) -> np.ndarray:
+    """
+    每个模板与同颜色、同方向其他模板的最大 TM_CCOEFF_NORMED，错位不超过 shift 像素
+    （另一模板四周补 shift 像素的 0，与帧上掩码外为 0 一致；尺寸不同时同样在补边后的图内滑动）。
+    空模板或没有同组模板时为 -1。先验复核据此设定阈值：得分须高出最相似的同组模板一段余量。
+    """
+    groups: Dict[Tuple, List[int]] = {}
+    for template_id, entry in enumerate(bank.entries):
+        if not entry.is_empty:
+            groups.setdefault((entry.color, entry.template.orientation), []).append(template_id)
+
+    similarity = np.full(len(bank.entries), -1.0)
+    for ids in groups.values():
+        padded = {i: cv2.copyMakeBorder(bank.entries[i].gray, shift, shift, shift, shift, cv2.BORDER_CONSTANT, value=0)
+                  for i in ids}
+        for a in ids:
+            for b in ids:
+                template, image = bank.entries[a].gray, padded[b]
+                if a == b or template.shape[0] > image.shape[0] or template.shape[1] > image.shape[1]:
+                    continue
+                similarity[a] = max(similarity[a], float(cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED).max()))
+    return similarity
+
+def _ncc_stats(gray: np.ndarray) -> Tuple[float, float]:
+    """去均值 NCC 统计量 (均值, 去均值 L2 范数)"""
+    values = gray.astype(np.float64)
+    mean = float(values.mean())
+    return mean, float(np.sqrt(((values - mean) ** 2).sum()))
+
+def compile_template(template: Template, color_range: Dict[str, List[int]]) -> CompiledTemplate:
+    """对单个模板执行与帧相同的 HSV 掩码 + 灰度化，并计算 NCC 统计量"""
+    lower_bound = np.array(color_range['lower'])
+    upper_bound = np.array(color_range['upper'])
+    hsv_template = cv2.cvtColor(template.image, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv_template, lower_bound, upper_bound)
+    masked_template = cv2.bitwise_and(template.image, template.image, mask=mask)
+    gray = cv2.cvtColor(masked_template, cv2.COLOR_BGR2GRAY)
+
+    mean, norm = _ncc_stats(gray)
+    return CompiledTemplate(
+        template=template,
+        gray=gray,
+        mask=mask,
+        is_empty=not gray.any(),
+        mean=mean,
+        norm=norm
+    )
+
+def scale_template(template: Template, scale: float) -> Template:
+    """按缩放比例生成新模板（缩小用 INTER_AREA，放大用 INTER_LINEAR），shape 随之更新"""
+    w, h = template.shape
+    size = (max(int(round(w * scale)), 1), max(int(round(h * scale)), 1))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    image = cv2.resize(template.image, size, interpolation=interpolation)
+    return replace(template, image=image, shape=size)
+
 class TemplatesManager:
     """
     最终版模板库管理器
     - 高效、稳定，只处理标准英文文件名
     """
 
-    def __init__(self, template_dir: str):
+    def __init__(self, template_dir: str, color_ranges: Optional[Dict[str, Dict[str, List[int]]]] = None,
+                 cache_path: Optional[str] = None, use_cache: bool = True, cluster_radius: float = 0.9):
         self.template_dir = Path(template_dir)
+        # 相似模板聚类的最大夹角（弧度）；越大簇越少，但代表的放行阈值越低
+        self.cluster_radius = cluster_radius
+        # 同组模板相似度允许的最大错位（像素），见 sibling_similarity
+        self.similarity_shift = 3
         self.templates: Dict[str, Template] = {}
+        self.color_ranges = color_ranges
+        # bank 为当前缩放比例下使用的模板库；base_bank 为原始尺寸模板库
+        self.bank: Optional[TemplateBank] = None
+        self.base_bank: Optional[TemplateBank] = None
+        self.scale = 1.0
+        # 按缩放比例缓存的模板库，及按 (缩放比例, 缩小倍数) 缓存的粗匹配模板库（随 compile_bank 失效）
+        self._scaled_banks: Dict[float, TemplateBank] = {}
+        self._coarse_banks: Dict[Tuple[float, int], TemplateBank] = {}
+        # 磁盘缓存默认放在模板目录下的 .cache 中（不会被 *.png 扫描到）
+        self.cache: Optional[TemplateCache] = None
+        if use_cache:
+            self.cache = TemplateCache(Path(cache_path) if cache_path else self.template_dir / ".cache" / "template_bank.npz")
+        self._file_keys: Dict[str, str] = {}
         self.load_templates()
 
     def _parse_filename(self, filename: str) -> Optional[Dict]:
@@ -71,27 +273,36 @@ class TemplatesManager:
     def load_templates(self) -> None:
         """加载所有标准模板文件"""
         self.templates.clear()
+        self._file_keys.clear()
         if not self.template_dir.is_dir():
             return
 
-        for file_path in self.template_dir.glob("*.png"):
+        # 排序保证模板顺序（即模板 ID）在不同机器上一致
+        for file_path in sorted(self.template_dir.glob("*.png")):
             parsed_info = self._parse_filename(file_path.name)
             if not parsed_info:
                 logger.warning(f"文件名格式不规范，已跳过: {file_path.name}")
                 continue
 
             try:
-                # 使用 cv2.imdecode 从内存读取，以正确处理路径编码
-                with open(file_path, "rb") as f:
-                    file_bytes = np.fromfile(f, dtype=np.uint8)
-                image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+                name = file_path.stem
+                key = file_key(file_path)
+                cached = self.cache.get("image", name, key) if self.cache else None
+                if cached:
+                    image = cached[0]["image"]
+                else:
+                    # 使用 cv2.imdecode 从内存读取，以正确处理路径编码
+                    with open(file_path, "rb") as f:
+                        file_bytes = np.fromfile(f, dtype=np.uint8)
+                    image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
 
-                if image is None:
-                    logger.warning(f"无法读取图片文件: {file_path.name}")
-                    continue
+                    if image is None:
+                        logger.warning(f"无法读取图片文件: {file_path.name}")
+                        continue
+                    if self.cache:
+                        self.cache.put("image", name, key, {"image": image})
 
                 h, w = image.shape[:2]
-                name = file_path.stem
 
                 template = Template(
                     name=name,
@@ -105,12 +316,195 @@ class TemplatesManager:
                     orientation=parsed_info['position']  # 使用position作为orientation
                 )
                 self.templates[name] = template
+                self._file_keys[name] = key
 
             except Exception as e:
                 logger.error(f"加载模板失败 {file_path.name}: {e}")
 
         logger.info(f"模板加载完成。共加载 {len(self.templates)} 个模板。")
 
+        if self.cache:
+            self.cache.prune("image", self.templates.keys())
+        if self.color_ranges:
+            self.compile_bank(self.color_ranges)
+        elif self.cache:
+            self.cache.save()
+
+    def compile_bank(self, color_ranges: Dict[str, Dict[str, List[int]]]) -> TemplateBank:
+        """
+        预编译模板库：每个模板只在加载时做一次掩码/灰度化，
+        之后每帧的匹配直接使用编译结果。没有对应颜色范围的模板（如营地）不入库。
+        """
+        bank = TemplateBank()
+        for template in self.templates.values():
+            color_range = color_ranges.get(template.color)
+            if color_range is None:
+                continue
+            bank.by_color.setdefault(template.color, []).append(len(bank.entries))
+            bank.entries.append(self._compile_cached(template, color_range))
+
+        self.color_ranges = color_ranges
+        self.bank = self.base_bank = bank
+        self.scale = 1.0
+        self._scaled_banks = {1.0: bank}
+        self._coarse_banks.clear()
+        self._attach_hierarchy(bank, 1.0)
+        if self.cache:
+            self.cache.prune("compiled", (e.template.name for e in bank.entries))
+            self._prune_scales(None)
+            self.cache.save()
+            logger.info(f"模板缓存命中 {self.cache.hits} 次，未命中 {self.cache.misses} 次。")
+        logger.info(f"模板库编译完成。共 {len(bank.entries)} 个模板，{len(bank.by_color)} 种颜色。")
+        return bank
+
+    def _compile_cached(self, template: Template, color_range: Dict[str, List[int]]) -> CompiledTemplate:
+        """优先从磁盘缓存取编译结果；模板文件或颜色范围变化时重新编译该条目"""
+        if not self.cache:
+            return compile_template(template, color_range)
+
+        key = f"{self._file_keys.get(template.name, '')}|{params_key(color_range)}"
+        cached = self.cache.get("compiled", template.name, key)
+        if cached:
+            arrays, meta = cached
+            return CompiledTemplate(
+                template=template,
+                gray=arrays["gray"],
+                mask=arrays["mask"],
+                is_empty=meta["is_empty"],
+                mean=meta["mean"],
+                norm=meta["norm"]
+            )
+
+        compiled = compile_template(template, color_range)
+        self.cache.put("compiled", template.name, key,
+                       {"gray": compiled.gray, "mask": compiled.mask},
+                       {"is_empty": compiled.is_empty, "mean": compiled.mean, "norm": compiled.norm})
+        return compiled
+
+    def coarse_bank(self, factor: int = 2) -> TemplateBank:
+        """当前模板库缩小 factor 倍的版本，首次请求时生成并缓存"""
+        key = (self.scale, factor)
+        if key not in self._coarse_banks:
+            self._coarse_banks[key] = self.bank.downscaled(factor)
+        return self._coarse_banks[key]
+
+    def scaled_bank(self, scale: float) -> TemplateBank:
+        """
+        指定缩放比例的模板库（不切换当前库），模板 ID 与原始库一致。
+        用过的比例（use_scale）直接取内存中的库；其余比例临时生成，可读磁盘缓存但不写入、不建立相似模板层级，
+        校准时试探的比例（见 GameAnalyzer.calibrate_scale）因此不会留在内存和磁盘上。
+        """
+        bank = self._scaled_banks.get(scale)
+        if bank is None:
+            bank = TemplateBank(by_color={c: list(ids) for c, ids in self.base_bank.by_color.items()})
+            for entry in self.base_bank.entries:
+                bank.entries.append(self._compile_scaled(entry.template, self.color_ranges[entry.color], scale))
+        return bank
+
+    def use_scale(self, scale: float) -> TemplateBank:
+        """
+        切换到指定缩放比例的模板库（适配不同 DPI / 窗口尺寸）。
+        该比例的库在内存中保留，并与其层级一起写入磁盘缓存；磁盘上只保留这一个缩放比例（见 _prune_scales）。
+        """
+        bank = self._scaled_banks.get(scale)
+        if bank is None:
+            bank = self.scaled_bank(scale)
+            self._attach_hierarchy(bank, scale)
+            self._scaled_banks[scale] = bank
+            logger.info(f"已生成缩放比例 {scale:.2f} 的模板库。")
+        if self.cache:
+            self._persist_scaled(bank, scale)
+            self._prune_scales(scale)
+            self.cache.save()
+        self.bank = bank
+        self.scale = scale
+        return self.bank
+
+    def _persist_scaled(self, bank: TemplateBank, scale: float) -> None:
+        """把某一比例的编译结果写入磁盘缓存的 "scaled" 分区（已缓存且未失效的条目不重写；1.0 在 "compiled" 分区）"""
+        if scale == 1.0:
+            return
+        for entry in bank.entries:
+            name = f"{entry.template.name}@{scale:.2f}"
+            key = f"{self._file_keys.get(entry.template.name, '')}|{params_key(self.color_ranges[entry.color])}"
+            if self.cache.entries.get(("scaled", name), {}).get("key") == key:
+                continue
+            self.cache.put("scaled", name, key,
+                           {"image": entry.template.image, "gray": entry.gray, "mask": entry.mask},
+                           {"is_empty": entry.is_empty, "mean": entry.mean, "norm": entry.norm})
+
+    def _prune_scales(self, scale: Optional[float]) -> None:
+        """
+        磁盘缓存的 "scaled"、"hierarchy" 分区只保留一个缩放比例（另加 1.0 的层级），冷启动不必读入用不到的比例。
+        scale 为 None（加载时）按现有条目推断：只有一个比例时保留它，多于一个（旧版本缓存）时全部删除
+        """
+        scales = {name.split("@")[1] for section, name in self.cache.entries if section == "scaled"}
+        if scale is not None:
+            keep = f"{scale:.2f}"
+        else:
+            keep = scales.pop() if len(scales) == 1 else None
+        self.cache.prune("scaled", (name for section, name in self.cache.entries
+                                    if section == "scaled" and name.split("@")[0] in self.templates
+                                    and name.split("@")[1] == keep))
+        self.cache.prune("hierarchy", {"1.00", keep})
+
+    def _compile_scaled(self, template: Template, color_range: Dict[str, List[int]], scale: float) -> CompiledTemplate:
+        """缩放后再按与原始模板相同的流程编译；磁盘缓存中有该 (模板, 比例) 时直接取用（写入见 _persist_scaled）"""
+        if not self.cache:
+            return compile_template(scale_template(template, scale), color_range)
+
+        name = f"{template.name}@{scale:.2f}"
+        key = f"{self._file_keys.get(template.name, '')}|{params_key(color_range)}"
+        cached = self.cache.get("scaled", name, key)
+        if cached:
+            arrays, meta = cached
+            h, w = arrays["image"].shape[:2]
+            return CompiledTemplate(
+                template=replace(template, image=arrays["image"], shape=(w, h)),
+                gray=arrays["gray"],
+                mask=arrays["mask"],
+                is_empty=meta["is_empty"],
+                mean=meta["mean"],
+                norm=meta["norm"]
+            )
+
+        return compile_template(scale_template(template, scale), color_range)
+
+    def _attach_hierarchy(self, bank: TemplateBank, scale: float) -> None:
+        """为模板库建立相似模板层级与同组相似度；结果随模板库一起写入磁盘缓存的 "hierarchy" 分区"""
+        key = params_key([[e.template.name, self._file_keys.get(e.template.name, '')] for e in bank.entries]
+                         + [self.color_ranges, self.cluster_radius, self.similarity_shift])
+        name = f"{scale:.2f}"
+        cached = self.cache.get("hierarchy", name, key) if self.cache else None
+        if cached:
+            arrays, _ = cached
+            bank.similarity = arrays["similarity"]
+            bank.clusters = [TemplateCluster(int(rep), np.flatnonzero(arrays["labels"] == index).tolist(), float(radius))
+                             for index, (rep, radius) in enumerate(zip(arrays["representatives"], arrays["radii"]))]
+            return
+
+        bank.clusters = build_hierarchy(bank, self.cluster_radius)
+        bank.similarity = sibling_similarity(bank, self.similarity_shift)
+        if self.cache:
+            labels = np.full(len(bank.entries), -1, dtype=np.int32)
+            for index, cluster in enumerate(bank.clusters):
+                labels[cluster.members] = index
+            self.cache.put("hierarchy", name, key, {
+                "labels": labels,
+                "representatives": np.array([c.representative for c in bank.clusters], dtype=np.int32),
+                "radii": np.array([c.radius for c in bank.clusters], dtype=np.float64),
+                "similarity": bank.similarity
+            })
+        logger.info(f"相似模板层级: {len(bank.clusters)} 个簇（缩放比例 {scale:.2f}）。")
+
+    def camp_template(self) -> Optional[Template]:
+        """营地模板 (template_xingying.png)，用于估计棋盘缩放比例"""
+        return self.templates.get("template_xingying")
+
+    def bank_templates(self) -> List[Template]:
+        """编译模板库中的原始模板，下标即模板 ID"""
+        return [entry.template for entry in self.bank.entries] if self.bank else []
+
     def get_all_templates(self) -> List[Template]:
         return list(self.templates.values())
 
@@ -4,7 +4,27 @@
 """
 import cv2
 import numpy as np
-from typing import Tuple, Optional, List
+from functools import lru_cache
+from typing import Tuple, Optional, List, Dict, Sequence, Union
+
+_KERNEL_SHAPES = {"ellipse": cv2.MORPH_ELLIPSE, "rect": cv2.MORPH_RECT, "cross": cv2.MORPH_CROSS}
+_MORPH_OPS = {"open": cv2.MORPH_OPEN, "close": cv2.MORPH_CLOSE, "erode": cv2.MORPH_ERODE, "dilate": cv2.MORPH_DILATE}
+
+
+@lru_cache(maxsize=None)
+def _structuring_element(shape: str, size: int) -> np.ndarray:
+    """结构元素按 (形状, 大小) 缓存；只读，未知形状按椭圆处理"""
+    kernel = cv2.getStructuringElement(_KERNEL_SHAPES.get(shape, cv2.MORPH_ELLIPSE), (size, size))
+    kernel.setflags(write=False)
+    return kernel
+
+
+@lru_cache(maxsize=None)
+def _gamma_lut(gamma: float) -> np.ndarray:
+    """gamma 校正查找表按 gamma 缓存；只读"""
+    table = (np.power(np.arange(256) / 255.0, 1.0 / gamma) * 255).astype(np.uint8)
+    table.setflags(write=False)
+    return table
 
 
 def preprocess_image(img: np.ndarray,
@@ -21,11 +41,11 @@ def preprocess_image(img: np.ndarray,
         equalize: 是否直方图均衡化
 
     Returns:
-        处理后的图像
+        处理后的图像（新数组，不与输入共享内存）
     """
-    processed = img.copy()
+    processed = img
 
-    # 转换颜色空间
+    # 转换颜色空间（cvtColor / normalize / equalizeHist 都返回新数组，无需预先复制输入）
     if method == "grayscale":
         processed = cv2.cvtColor(processed, cv2.COLOR_BGR2GRAY)
     elif method == "hsv":
@@ -41,7 +61,8 @@ def preprocess_image(img: np.ndarray,
     if equalize and len(processed.shape) == 2:
         processed = cv2.equalizeHist(processed)
 
-    return processed
+    # 没有任何步骤生效时才复制，保证调用方修改结果不会影响输入
+    return processed.copy() if processed is img else processed
 
 
 def enhance_contrast(img: np.ndarray,
@@ -64,11 +85,7 @@ def enhance_contrast(img: np.ndarray,
         clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=grid_size)
         return clahe.apply(img)
     elif method == "gamma":
-        gamma = 1.2
-        inv_gamma = 1.0 / gamma
-        table = np.array([((i / 255.0) ** inv_gamma) * 255
-                        for i in np.arange(0, 256)]).astype("uint8")
-        return cv2.LUT(img, table)
+        return cv2.LUT(img, _gamma_lut(1.2))
     elif method == "stretch":
         return cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX)
     else:
@@ -96,9 +113,7 @@ def remove_noise(img: np.ndarray,
     elif method == "bilateral":
         return cv2.bilateralFilter(img, kernel_size, 75, 75)
     elif method == "morphology":
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
-                                          (kernel_size, kernel_size))
-        return cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel)
+        return cv2.morphologyEx(img, cv2.MORPH_OPEN, _structuring_element("ellipse", kernel_size))
     else:
         return img
 
@@ -147,18 +162,7 @@ def morphological_operations(img: np.ndarray,
     Returns:
         处理后的图像
     """
-    if kernel_shape == "ellipse":
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
-                                          (kernel_size, kernel_size))
-    elif kernel_shape == "rect":
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT,
-                                          (kernel_size, kernel_size))
-    elif kernel_shape == "cross":
-        kernel = cv2.getStructuringElement(cv2.MORPH_CROSS,
-                                          (kernel_size, kernel_size))
-    else:
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
-                                          (kernel_size, kernel_size))
+    kernel = _structuring_element(kernel_shape, kernel_size)
 
     if operation == "open":
         return cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel, iterations=iterations)
@@ -172,6 +176,203 @@ def morphological_operations(img: np.ndarray,
         return img
 
 
+class PreprocessPipeline:
+    """
+    可复用的预处理流水线：构造时建好 CLAHE 对象、gamma 查找表与结构元素，之后逐帧/逐格子直接复用
+    链路: 灰度 → 归一化 → 对比度增强 → 去噪 → 自适应阈值 → 形态学（各步可关闭）
+    除双边滤波外各步都在同一个缓冲区内原地进行，整条链路只分配一次输出。
+    CLAHE 对象带内部状态，同一个流水线不要跨线程共用。
+
+    Args:
+        normalize: 是否 MINMAX 归一化到 0-255
+        contrast: 对比度增强 ("clahe", "gamma", "stretch", None)
+        clip_limit, grid_size: CLAHE 参数
+        gamma: gamma 校正系数
+        denoise: 去噪方法 ("gaussian", "median", "bilateral", "morphology", None)
+        denoise_kernel: 去噪核大小（奇数）
+        threshold: 自适应阈值方法 ("gaussian", "mean", None)
+        block_size, c: 自适应阈值参数
+        morphology: 依次执行的形态学操作，如 ("close", "open")
+        kernel_shape, kernel_size: 形态学操作的结构元素
+    """
+
+    def __init__(self,
+                 normalize: bool = True,
+                 contrast: Optional[str] = "clahe",
+                 clip_limit: float = 2.0,
+                 grid_size: Tuple[int, int] = (8, 8),
+                 gamma: float = 1.2,
+                 denoise: Optional[str] = None,
+                 denoise_kernel: int = 3,
+                 threshold: Optional[str] = None,
+                 block_size: int = 11,
+                 c: float = 2.0,
+                 morphology: Sequence[str] = (),
+                 kernel_shape: str = "ellipse",
+                 kernel_size: int = 3):
+        self.normalize = normalize
+        self.contrast = contrast
+        self.denoise = denoise
+        self.denoise_kernel = denoise_kernel
+        self.threshold = threshold
+        self.block_size = block_size
+        self.c = c
+
+        self._clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tuple(grid_size)) \
+            if contrast == "clahe" else None
+        self._gamma_lut = _gamma_lut(gamma) if contrast == "gamma" else None
+        self._denoise_kernel = _structuring_element("ellipse", denoise_kernel) if denoise == "morphology" else None
+        self._morphology = [_MORPH_OPS[operation] for operation in morphology]
+        self._morph_kernel = _structuring_element(kernel_shape, kernel_size) if self._morphology else None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> "PreprocessPipeline":
+        """从配置字典构造（键同构造参数，缺省项取默认值）"""
+        return cls(**(config or {}))
+
+    def apply(self, img: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        处理一帧或一个格子
+
+        Args:
+            img: 输入图像（BGR 或灰度），不会被修改
+            out: 可选的输出缓冲区（与输入同尺寸的 uint8 单通道）
+
+        Returns:
+            处理后的单通道图像（给出 out 时即 out）
+        """
+        if img.ndim == 3:
+            image = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=out)
+        elif out is not None:
+            np.copyto(out, img)
+            image = out
+        else:
+            image = img.copy()
+
+        if self.normalize:
+            cv2.normalize(image, image, 0, 255, cv2.NORM_MINMAX)
+
+        if self._clahe is not None:
+            self._clahe.apply(image, dst=image)
+        elif self._gamma_lut is not None:
+            cv2.LUT(image, self._gamma_lut, dst=image)
+        elif self.contrast == "stretch":
+            cv2.normalize(image, image, 0, 255, cv2.NORM_MINMAX)
+
+        if self.denoise == "gaussian":
+            cv2.GaussianBlur(image, (self.denoise_kernel, self.denoise_kernel), 0, dst=image)
+        elif self.denoise == "median":
+            cv2.medianBlur(image, self.denoise_kernel, dst=image)
+        elif self.denoise == "bilateral":
+            # 双边滤波不支持原地处理
+            np.copyto(image, cv2.bilateralFilter(image, self.denoise_kernel, 75, 75))
+        elif self.denoise == "morphology":
+            cv2.morphologyEx(image, cv2.MORPH_OPEN, self._denoise_kernel, dst=image)
+
+        if self.threshold in ("gaussian", "mean"):
+            method = cv2.ADAPTIVE_THRESH_GAUSSIAN_C if self.threshold == "gaussian" else cv2.ADAPTIVE_THRESH_MEAN_C
+            cv2.adaptiveThreshold(image, 255, method, cv2.THRESH_BINARY, self.block_size, self.c, dst=image)
+
+        for operation in self._morphology:
+            cv2.morphologyEx(image, operation, self._morph_kernel, dst=image)
+
+        return image
+
+    def apply_batch(self, crops: Sequence[np.ndarray]) -> Union[np.ndarray, List[np.ndarray]]:
+        """
+        处理一批格子图像；每个格子独立归一化/增强，结果与逐个 apply() 相同
+        尺寸一致时结果写入一个 (N, H, W) 数组，否则返回列表
+        """
+        shapes = {crop.shape[:2] for crop in crops}
+        if len(shapes) != 1:
+            return [self.apply(crop) for crop in crops]
+        out = np.empty((len(crops), *shapes.pop()), dtype=np.uint8)
+        for crop, dst in zip(crops, out):
+            self.apply(crop, out=dst)
+        return out
+
+
+def grid_nms(boxes: np.ndarray,
+             scores: np.ndarray,
+             iou_threshold: float,
+             pixel_offset: int = 0,
+             suppress_on_equal: bool = True,
+             order: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    基于均匀空间网格的贪心 NMS（与逐对比较的经典贪心 NMS 保留集完全一致）
+
+    网格边长取最大框的宽高，因此有交集的两个框左上角所在格子最多相差 1，
+    每个保留框只需与周围 3x3 个格子内的框比较，整体复杂度随候选数近似线性。
+
+    Args:
+        boxes: (N, 4) 边界框 (x1, y1, x2, y2)
+        scores: (N,) 置信度
+        iou_threshold: IOU阈值
+        pixel_offset: 宽高计算偏移（0: x2-x1；1: x2-x1+1，像素闭区间约定）
+        suppress_on_equal: True 时 IOU >= 阈值即抑制，False 时需 IOU > 阈值
+        order: 处理顺序（下标排列），默认按分数降序、同分保持输入顺序
+
+    Returns:
+        按处理顺序排列的保留下标数组
+    """
+    n = len(scores)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    boxes = np.asarray(boxes, dtype=np.int64)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1 + pixel_offset) * (y2 - y1 + pixel_offset)
+    if order is None:
+        order = np.argsort(-np.asarray(scores), kind='stable')
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+
+    # 阈值 <= 0 时不相交的框也可能被抑制，退化为单个格子（全量比较）
+    overlap_only = iou_threshold > 0 or (iou_threshold == 0 and not suppress_on_equal)
+    if overlap_only:
+        cell = max(int((x2 - x1 + pixel_offset).max()), int((y2 - y1 + pixel_offset).max()), 1)
+        gx, gy = x1 // cell, y1 // cell
+    else:
+        gx, gy = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+
+    # 按格子分桶
+    cell_keys = list(zip(gx.tolist(), gy.tolist()))
+    buckets: dict = {}
+    for idx, key in enumerate(cell_keys):
+        buckets.setdefault(key, []).append(idx)
+    buckets = {key: np.array(members, dtype=np.int64) for key, members in buckets.items()}
+    neighbours: dict = {}
+    empty = np.empty(0, dtype=np.int64)
+
+    suppressed = np.zeros(n, dtype=bool)
+    keep = []
+    for i in order:
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        key = cell_keys[i]
+        candidates = neighbours.get(key)
+        if candidates is None:
+            gxi, gyi = key
+            candidates = np.concatenate([buckets.get((gxi + dx, gyi + dy), empty)
+                                         for dx in (-1, 0, 1) for dy in (-1, 0, 1)]) if overlap_only else buckets[key]
+            neighbours[key] = candidates
+        # 只抑制排名在后、尚未被抑制的框
+        candidates = candidates[(rank[candidates] > rank[i]) & ~suppressed[candidates]]
+        if candidates.size == 0:
+            continue
+
+        w = np.maximum(0, np.minimum(x2[i], x2[candidates]) - np.maximum(x1[i], x1[candidates]) + pixel_offset)
+        h = np.maximum(0, np.minimum(y2[i], y2[candidates]) - np.maximum(y1[i], y1[candidates]) + pixel_offset)
+        inter = w * h
+        union = areas[i] + areas[candidates] - inter
+        iou = np.where(union > 0, inter / np.maximum(union, 1), 0.0)
+        hit = iou >= iou_threshold if suppress_on_equal else iou > iou_threshold
+        suppressed[candidates[hit]] = True
+
+    return np.array(keep, dtype=np.int64)
+
+
 def non_max_suppression(boxes: List[Tuple[int, int, int, int]],
                        scores: List[float],
                        iou_threshold: float = 0.3) -> List[int]:
@@ -189,39 +390,116 @@ def non_max_suppression(boxes: List[Tuple[int, int, int, int]],
     if len(boxes) == 0:
         return []
 
-    boxes = np.array(boxes)
+    # 像素闭区间约定 (宽 = x2 - x1 + 1)，IOU 严格大于阈值才抑制；
+    # 处理顺序沿用 argsort()[::-1]（同分时的先后与原实现一致）
     scores = np.array(scores)
+    keep = grid_nms(np.array(boxes), scores, iou_threshold,
+                    pixel_offset=1, suppress_on_equal=False, order=scores.argsort()[::-1])
+    return keep.tolist()
 
-    # 转换为 (x, y, w, h) 格式
-    x1 = boxes[:, 0]
-    y1 = boxes[:, 1]
-    x2 = boxes[:, 2]
-    y2 = boxes[:, 3]
 
-    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-    order = scores.argsort()[::-1]
+def find_peaks(score_map: np.ndarray,
+              threshold: float,
+              top_k: Optional[int] = None,
+              neighborhood: int = 3,
+              scratch: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    从 matchTemplate 得分图中提取局部极大值（整图向量化）
 
-    keep = []
-    while order.size > 0:
-        i = order[0]
-        keep.append(i)
+    与 np.where(score >= threshold) 不同，真实匹配周围整片平台只保留峰值点，
+    候选数量在进入 NMS 之前就减少几个数量级。
 
-        xx1 = np.maximum(x1[i], x1[order[1:]])
-        yy1 = np.maximum(y1[i], y1[order[1:]])
-        xx2 = np.minimum(x2[i], x2[order[1:]])
-        yy2 = np.minimum(y2[i], y2[order[1:]])
+    Args:
+        score_map: 得分图 (float32)
+        threshold: 匹配阈值
+        top_k: 每张得分图最多保留的峰值数（按分数），None 表示不限制
+        neighborhood: 极大值判定邻域边长（奇数）
+        scratch: 与 score_map 同形状的 float32 缓冲区，用于存放膨胀结果（None 时新分配）
 
-        w = np.maximum(0, xx2 - xx1 + 1)
-        h = np.maximum(0, yy2 - yy1 + 1)
+    Returns:
+        (xs, ys, scores)，按行优先顺序排列；启用 top_k 时按分数降序
+    """
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+    if score_map.size == 0:
+        return empty
+    _, max_val, _, _ = cv2.minMaxLoc(score_map)
+    if max_val < threshold:
+        return empty
+
+    # 膨胀后与原图相等的位置即邻域内最大值
+    kernel = np.ones((neighborhood, neighborhood), dtype=np.uint8)
+    dilated = cv2.dilate(score_map, kernel, dst=scratch)
+    ys, xs = np.nonzero((score_map >= threshold) & (score_map >= dilated))
+    scores = score_map[ys, xs]
+
+    if top_k is not None and len(scores) > top_k:
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        xs, ys, scores = xs[top], ys[top], scores[top]
+    return xs, ys, scores
+
+
+def build_hsv_label_luts(color_ranges: Dict[str, Dict[str, List[int]]]) -> np.ndarray:
+    """
+    由各颜色的 HSV 范围生成逐通道位掩码查找表
 
-        inter = w * h
-        union = areas[i] + areas[order[1:]] - inter
-        iou = inter / union
+    inRange 是三个通道区间的交集，因此可以拆成三张 256 项的表：
+    第 i 种颜色在 H/S/V 表中对应位置上置第 i 位，三张表查表结果按位与即得该像素命中的颜色。
+
+    Args:
+        color_ranges: {颜色: {'lower': [h, s, v], 'upper': [h, s, v]}}，按插入顺序编号，最多 8 种
 
-        inds = np.where(iou <= iou_threshold)[0]
-        order = order[inds + 1]
+    Returns:
+        (3, 256) uint8 查找表；标签图中颜色 i 的标签值为 i + 1
+    """
+    if len(color_ranges) > 8:
+        raise ValueError("标签查找表最多支持 8 种颜色")
+    ranges = list(color_ranges.values())
+    for i in range(len(ranges)):
+        for j in range(i + 1, len(ranges)):
+            if all(ranges[i]['lower'][c] <= ranges[j]['upper'][c] and ranges[j]['lower'][c] <= ranges[i]['upper'][c]
+                   for c in range(3)):
+                raise ValueError("颜色 HSV 范围存在重叠，无法生成互斥的颜色标签")
 
-    return keep
+    luts = np.zeros((3, 256), dtype=np.uint8)
+    for bit, color_range in enumerate(ranges):
+        for channel in range(3):
+            lower, upper = color_range['lower'][channel], color_range['upper'][channel]
+            luts[channel, lower:upper + 1] |= np.uint8(1 << bit)
+    return luts
+
+
+# 位掩码 -> 标签值（最低置位 + 1，0 表示无颜色）
+_BIT_TO_LABEL = np.array([0] + [(v & -v).bit_length() for v in range(1, 256)], dtype=np.uint8)
+
+
+def hsv_label_image(img: np.ndarray, luts: np.ndarray, out: Optional[np.ndarray] = None, arena=None) -> np.ndarray:
+    """
+    单次 HSV 转换 + 查表生成颜色标签图，与逐颜色 inRange 的结果逐像素一致
+
+    掩码决定了棋子文字笔画的形状，必须在全分辨率下计算：
+    半分辨率掩码放大后，真实匹配位置的得分会从 1.0 掉到 0.5 左右。
+
+    Args:
+        img: BGR 图像
+        luts: build_hsv_label_luts 生成的查找表
+        out: 输出标签图缓冲区（None 时新分配）
+        arena: 中间结果（HSV 图与三个通道）使用的 BufferArena（None 时每次新分配）
+
+    Returns:
+        与输入同尺寸的 uint8 标签图（0 = 无颜色，1..N = 颜色编号 + 1）
+    """
+    if arena is None:
+        hue, saturation, value = cv2.split(cv2.cvtColor(img, cv2.COLOR_BGR2HSV))
+    else:
+        shape = img.shape[:2]
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV, dst=arena.get("hsv", img.shape))
+        hue, saturation, value = cv2.split(hsv, [arena.get(name, shape) for name in ("hue", "saturation", "value")])
+    # 三个通道就地查表、按位与，只有最终标签图写入 out
+    bits = cv2.LUT(hue, luts[0], dst=hue)
+    cv2.bitwise_and(bits, cv2.LUT(saturation, luts[1], dst=saturation), dst=bits)
+    cv2.bitwise_and(bits, cv2.LUT(value, luts[2], dst=value), dst=bits)
+    return cv2.LUT(bits, _BIT_TO_LABEL, dst=out)
 
 
 def extract_cell_image(img: np.ndarray,